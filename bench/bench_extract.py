@@ -0,0 +1,122 @@
+"""比較舊的整頁 BeautifulSoup 解析與 extract.py 的局部解析
+
+以 bench/fixtures 中存下來的頁面量測每頁解析時間與峰值記憶體
+（tracemalloc 只統計 Python 物件，不含 libxml2 在 C 端配置的記憶體）。
+執行：python bench/bench_extract.py
+"""
+import os, re, sys, timeit, tracemalloc
+from urllib.parse import urljoin
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup
+from extract import clean_url, extract_ltn_article, extract_tvbs, extract_ettoday, extract_reddit
+
+FIXTURES = os.path.join(ROOT, "bench", "fixtures")
+RUNS = 20
+
+
+def fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# ---------- 舊版實作（整頁建 BeautifulSoup 樹），僅作為比較基準 ----------
+def soup_ltn_article(html: str, url: str, fallback_title: str):
+    soup2 = BeautifulSoup(html, "lxml")
+    h1 = soup2.select_one("h1")
+    title = h1.get_text(strip=True) if h1 else fallback_title
+    time_str = None
+    meta_time = soup2.find("meta", property="article:published_time")
+    if meta_time and meta_time.get("content"):
+        m = re.search(r"T(\d{2}:\d{2})", meta_time["content"])
+        if m:
+            time_str = m.group(1)
+    og_img = soup2.find("meta", property="og:image")
+    img_url = og_img["content"].strip() if og_img and og_img.get("content") else None
+    return title, time_str, clean_url(img_url, url)
+
+
+def soup_tvbs(html: str, limit: int, base: str):
+    soup = BeautifulSoup(html, "lxml")
+    items = []
+    for li in soup.select("li.news_list")[:limit]:
+        a = li.select_one("h2 a")
+        if not a:
+            continue
+        tnode = li.select_one(".time")
+        m = re.search(r"\b(\d{1,2}:\d{2})\b", tnode.get_text(" ", strip=True)) if tnode else None
+        img_el = li.select_one("img")
+        image = urljoin(base, img_el.get("src", "")) if img_el and img_el.get("src") else None
+        items.append((m.group(1) if m else None, a.get_text(strip=True), urljoin(base, a.get("href", "")), image))
+    return items
+
+
+def soup_ettoday(html: str, limit: int, base: str):
+    soup = BeautifulSoup(html, "lxml")
+    items = []
+    for h3 in soup.select("div.part_list_2 h3")[:limit]:
+        a = h3.select_one("a")
+        if not a:
+            continue
+        tnode = h3.select_one("span.date")
+        m = re.search(r"\b(\d{1,2}:\d{2})\b", tnode.get_text(" ", strip=True)) if tnode else None
+        image = None
+        sib_a = h3.find_previous_sibling("a")
+        if sib_a:
+            img = sib_a.select_one("img")
+            if img and img.get("src"):
+                image = urljoin(base, img.get("src"))
+        items.append((m.group(1) if m else None, a.get_text(strip=True), urljoin(base, a.get("href", "")), image))
+    return items
+
+
+def soup_reddit(html: str, limit: int):
+    soup = BeautifulSoup(html, "html.parser")
+    items = []
+    for p in soup.select("shreddit-post")[:limit]:
+        title = p.get("post-title") or p.get("data-adclicktitle")
+        url = p.get("content-href") or p.get("permalink")
+        if title and url:
+            items.append((None, title, url, p.get("thumbnail-url")))
+    return items
+
+
+CASES = [
+    ("ltn_article", "ltn_article.html",
+     lambda h: soup_ltn_article(h, "https://news.ltn.com.tw/news/1", "t"),
+     lambda h: extract_ltn_article(h, "https://news.ltn.com.tw/news/1", "t")),
+    ("tvbs", "tvbs_realtime.html",
+     lambda h: soup_tvbs(h, 10, "https://news.tvbs.com.tw/realtime"),
+     lambda h: extract_tvbs(h, 10, "https://news.tvbs.com.tw/realtime")),
+    ("ettoday", "ettoday_hot.html",
+     lambda h: soup_ettoday(h, 10, "https://www.ettoday.net/news/realtime-hot.htm"),
+     lambda h: extract_ettoday(h, 10, "https://www.ettoday.net/news/realtime-hot.htm")),
+    ("reddit", "reddit_games.html",
+     lambda h: soup_reddit(h, 10),
+     lambda h: extract_reddit(h, 10)),
+]
+
+
+def peak_kib(func, html: str) -> float:
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    print(f"{'page':<12} {'size(KiB)':>9} {'soup(ms)':>9} {'new(ms)':>8} {'speedup':>8} {'soup peak(KiB)':>15} {'new peak(KiB)':>14}")
+    for name, filename, old, new in CASES:
+        html = fixture(filename)
+        assert old(html) == new(html), f"{name}: 抽取結果與舊版不一致"
+        old_ms = timeit.timeit(lambda: old(html), number=RUNS) / RUNS * 1000
+        new_ms = timeit.timeit(lambda: new(html), number=RUNS) / RUNS * 1000
+        print(f"{name:<12} {len(html.encode()) / 1024:>9.1f} {old_ms:>9.2f} {new_ms:>8.2f} {old_ms / new_ms:>7.1f}x"
+              f" {peak_kib(old, html):>15.0f} {peak_kib(new, html):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
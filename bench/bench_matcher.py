@@ -0,0 +1,50 @@
+"""比較舊的線性子字串掃描與 KeywordMatcher 的單則訊息成本。
+
+執行：python bench/bench_matcher.py
+"""
+import os, random, string, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import KeywordMatcher
+
+SIZES = (10, 1_000, 50_000)
+MESSAGES = 200
+ALPHABET = string.ascii_lowercase + "一二三四五六七八九十"
+
+
+def random_word(rng: random.Random, lo: int, hi: int) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(lo, hi)))
+
+
+def linear_scan(responses: dict, text: str):
+    for keyword in responses:
+        if keyword in text:
+            return keyword
+    return None
+
+
+def main():
+    rng = random.Random(42)
+    messages = [random_word(rng, 20, 120) for _ in range(MESSAGES)]
+
+    print(f"{'keywords':>9} {'build(ms)':>10} {'scan(us/msg)':>13} {'index(us/msg)':>14} {'speedup':>8}")
+    for size in SIZES:
+        responses = {random_word(rng, 4, 10): "reply" for _ in range(size)}
+
+        start = timeit.default_timer()
+        matcher = KeywordMatcher(responses)
+        build_ms = (timeit.default_timer() - start) * 1000
+
+        for text in messages:
+            assert matcher.match(text) == linear_scan(responses, text)
+
+        scan = timeit.timeit(lambda: [linear_scan(responses, t) for t in messages], number=3)
+        index = timeit.timeit(lambda: [matcher.match(t) for t in messages], number=3)
+        scan_us = scan / (3 * MESSAGES) * 1e6
+        index_us = index / (3 * MESSAGES) * 1e6
+        print(f"{size:>9} {build_ms:>10.1f} {scan_us:>13.1f} {index_us:>14.1f} {scan_us / index_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
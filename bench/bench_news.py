@@ -0,0 +1,297 @@
+"""news_links 離線效能與回歸測試
+
+以本機 aiohttp server 重播 bench/fixtures 中的 RSS/HTML（支援 ETag/304），
+量測每個 NEWS_SOURCES 來源與完整新聞排程週期（抓取 + 分送）的：
+  - 吞吐量（pages/sec，server 實際回應的請求數 / 耗時）
+  - 延遲百分位（p50 / p95 / p99）
+  - 記憶體配置（tracemalloc 峰值與配置次數）
+分成 cold（清空所有快取）與 warm（HTTP 快取與解析結果都在，走 304）兩種情境。
+fixtures 不是實際錄下的頁面，而是依各網站頁面結構產生的假資料（標題、網址與圖片都是虛構的）。
+
+完全離線執行。與 bench/baseline_news.json 比較，p50 退步超過門檻時以 exit code 1 結束。
+每個情境量測前先跑一次參考工作量（直接解析 fixtures），以 p50 / 參考工作量的比值與基準比較，
+抵銷機器快慢（含執行中的降頻）的差異；
+迭代次數太少或差距小於 MIN_REGRESSION_MS 時不算退步（幾 ms 的 warm 情境雜訊很大）；
+有情境超過門檻時整組重跑一次，兩次都退步才以 exit code 1 結束。
+  python bench/bench_news.py                     # 量測並比對基準
+  python bench/bench_news.py --update-baseline   # 以本次結果更新基準
+  python bench/bench_news.py --threshold 0.3     # 允許 30% 退步（預設 50%）
+"""
+import argparse, asyncio, atexit, contextlib, hashlib, io, json, os, shutil, statistics, sys, tempfile, time, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+FIXTURES = os.path.join(ROOT, "bench", "fixtures")
+BASELINE = os.path.join(ROOT, "bench", "baseline_news.json")
+MIN_ITERATIONS = 10      # 少於這個次數的 p50 不穩定，只顯示結果不比對
+MIN_REGRESSION_MS = 5.0  # 與基準的差距至少要這麼多 ms 才算退步（cold 情境有幾 ms 的排程雜訊）
+
+# 快取與去重紀錄都放到暫存目錄，不碰正式資料
+TMP = tempfile.mkdtemp(prefix="toki-bench-")
+atexit.register(shutil.rmtree, TMP, ignore_errors=True)
+os.environ["NEWS_CACHE_DIR"] = os.path.join(TMP, "cache")
+os.environ["NEWS_SEEN_FILE"] = os.path.join(TMP, "seen.bin")
+os.environ["NEWS_SUBSCRIPTIONS_FILE"] = os.path.join(TMP, "subscriptions.json")
+os.environ["NEWS_STORIES_FILE"] = os.path.join(TMP, "stories.json")
+
+import discord
+from aiohttp import web
+import news, news_links
+from fetch_cache import FetchCache
+from subscriptions import Subscription
+from outbound import OutboundScheduler
+
+LTN_HOST = "https://news.ltn.com.tw"
+# 圖片 CDN 換成本機的 /img，縮圖檢查（HEAD / range GET）也不連外
+IMAGE_HOSTS = ("https://img.ltn.com.tw", "https://cc.tvbs.com.tw", '"//cdn2.ettoday.net', "https://b.thumbs.redditmedia.com")
+IMAGE_BYTES = 32 * 1024
+
+
+# ---------- 本機替身 server ----------
+class FixtureServer:
+    def __init__(self):
+        self.requests = 0
+        self.not_modified = 0
+        self.base = ""
+        self._runner = None
+
+    def _rewrite(self, body: str, rewrite: bool) -> str:
+        if rewrite:
+            body = body.replace(LTN_HOST, self.base + "/ltn")
+        for host in IMAGE_HOSTS:
+            body = body.replace(host, ('"' if host.startswith('"') else "") + self.base + "/img")
+        return body
+
+    def _serve(self, filename: str, content_type: str, rewrite: bool = False):
+        with open(os.path.join(FIXTURES, filename), "r", encoding="utf-8") as f:
+            body = f.read()
+
+        async def handler(request: web.Request):
+            self.requests += 1
+            text = self._rewrite(body, rewrite)
+            etag = '"' + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16] + '"'
+            if request.headers.get("If-None-Match") == etag:
+                self.not_modified += 1
+                return web.Response(status=304, headers={"ETag": etag})
+            return web.Response(text=text, content_type=content_type, headers={"ETag": etag})
+        return handler
+
+    async def _image(self, request: web.Request):
+        self.requests += 1
+        if request.headers.get("Range"):
+            return web.Response(status=206, body=b"\0" * 1024, content_type="image/jpeg",
+                                headers={"Content-Range": f"bytes 0-1023/{IMAGE_BYTES}"})
+        return web.Response(body=b"\0" * IMAGE_BYTES, content_type="image/jpeg")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/ltn/rss", self._serve("ltn_rss.xml", "application/xml", rewrite=True))
+        app.router.add_get("/ltn/news/{tail:.*}", self._serve("ltn_article.html", "text/html"))
+        app.router.add_get("/tvbs", self._serve("tvbs_realtime.html", "text/html"))
+        app.router.add_get("/ettoday", self._serve("ettoday_hot.html", "text/html"))
+        app.router.add_get("/reddit", self._serve("reddit_games.html", "text/html"))
+        app.router.add_get("/img/{tail:.*}", self._image)  # aiohttp 的 GET 路由同時處理 HEAD
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base = f"http://127.0.0.1:{port}"
+
+        news_links.LTN_RSS = self.base + "/ltn/rss"
+        news_links.TVBS_URL = self.base + "/tvbs"
+        news_links.ETTODAY_URL = self.base + "/ettoday"
+        news_links.REDDIT_URL = self.base + "/reddit"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def reset_caches():
+    """cold 情境：清空 HTTP 快取、解析結果、文章 metadata、縮圖檢查與來源結果"""
+    news_links.http_cache = FetchCache(os.path.join(TMP, f"cache-{time.monotonic_ns()}"))
+    news_links.thumbnails._cache.clear()
+    news_links._parsed.clear()
+    news_links._article_meta.clear()
+    news_links._results.clear()
+
+
+# ---------- 替身 Discord 物件 ----------
+class RecordingChannel(discord.TextChannel):
+    """通過 isinstance(TextChannel) 檢查、只記錄 send 的頻道"""
+
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, **kwargs):
+        self.sent += len(kwargs.get("embeds") or [None])
+
+
+class FakeBot:
+    def __init__(self, channel: RecordingChannel):
+        self.channel = channel
+        self.outbound = OutboundScheduler(channel_rate=10_000, channel_per=1.0, global_rate=10_000)
+
+    def get_channel(self, channel_id: int):
+        return self.channel if channel_id == self.channel.id else None
+
+
+# ---------- 量測 ----------
+_reference_pages: dict[str, str] = {}
+
+
+def reference_ms(rounds: int = 5) -> float:
+    """參考工作量：在本程序直接解析所有 fixtures，取最小值（只跟機器與 Python 當下的快慢有關）"""
+    from extract import extract_ltn_feed, extract_ltn_article, extract_tvbs, extract_ettoday, extract_reddit
+    pages = _reference_pages
+    if not pages:
+        for name in ("ltn_rss.xml", "ltn_article.html", "tvbs_realtime.html", "ettoday_hot.html", "reddit_games.html"):
+            with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+                pages[name] = f.read()
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        extract_ltn_feed(pages["ltn_rss.xml"], 5)
+        extract_ltn_article(pages["ltn_article.html"], LTN_HOST + "/news/1", "")
+        extract_tvbs(pages["tvbs_realtime.html"], 3, LTN_HOST)
+        extract_ettoday(pages["ettoday_hot.html"], 3, LTN_HOST)
+        extract_reddit(pages["reddit_games.html"], 2)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return min(samples)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def measure(name: str, server: FixtureServer, run, iterations: int, cold: bool) -> dict:
+    reference = reference_ms()
+    latencies = []
+    requests_before = server.requests
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    blocks_before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(iterations):
+            if cold:
+                reset_caches()
+            else:
+                news_links._results.clear()  # 只清結果，HTTP 快取與解析結果保留
+            t0 = time.perf_counter()
+            await run()
+            latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    blocks_after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+
+    pages = server.requests - requests_before
+    return {
+        "case": f"{name}/{'cold' if cold else 'warm'}",
+        "pages_per_sec": pages / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "peak_kib": peak / 1024,
+        "retained_blocks": blocks_after - blocks_before,
+        "reference_ms": reference,
+    }
+
+
+async def run_suite(iterations: int) -> list[dict]:
+    server = FixtureServer()
+    await server.start()
+    results = []
+    try:
+        # 先暖機 process pool 與連線池，避免第一次啟動成本算進結果
+        with contextlib.redirect_stdout(io.StringIO()):
+            for source in news_links.NEWS_SOURCES:
+                await news_links.NEWS_SOURCES[source]()
+
+        for source, fetch in news_links.NEWS_SOURCES.items():
+            for cold in (True, False):
+                results.append(await measure(source, server, fetch, iterations, cold))
+
+        channel = RecordingChannel(1)
+        cog = news.NewsManager(FakeBot(channel))
+        cog.subscriptions.add(Subscription(0, channel.id, "ltn", 3600.0))
+        cog.sync_schedules()
+
+        async def cycle():
+            cog.seen._items.clear()  # 每輪都當成新新聞，量到完整的發送路徑
+            cog.schedules["ltn"].next_due = 0.0
+            await cog.news_scheduler.coro(cog)
+
+        for cold in (True, False):
+            results.append(await measure("news_scheduler", server, cycle, max(3, iterations // 2), cold))
+    finally:
+        await news_links.close_session()
+        news_links.shutdown_parser_pool()
+        await server.stop()
+    return results
+
+
+def find_regressions(results: list[dict], baseline: dict, threshold: float) -> dict[str, str]:
+    regressions = {}
+    for r in results:
+        base = baseline.get(r["case"])
+        if not base:
+            continue
+        # 基準換算成這台機器當下的速度：參考工作量慢一倍，預期的 p50 也慢一倍
+        scale = r["reference_ms"] / base["reference_ms"] if base.get("reference_ms") else 1.0
+        expected = base["p50_ms"] * scale
+        if r["p50_ms"] > expected * (1 + threshold) and r["p50_ms"] - expected > MIN_REGRESSION_MS:
+            regressions[r["case"]] = (f"{r['case']}: p50 {r['p50_ms']:.2f}ms > 基準 {expected:.2f}ms × {1 + threshold:g}"
+                                      f"（機器速度換算 ×{scale:.2f}）")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=0.5, help="p50 允許退步的比例")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_suite(args.iterations))
+
+    print(f"{'case':<24} {'pages/s':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} {'peak(KiB)':>10} {'blocks':>8} {'ref(ms)':>8}")
+    for r in results:
+        print(f"{r['case']:<24} {r['pages_per_sec']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}"
+              f" {r['p99_ms']:>8.2f} {r['peak_kib']:>10.0f} {r['retained_blocks']:>8} {r['reference_ms']:>8.2f}")
+
+    if args.update_baseline:
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump({r["case"]: {"p50_ms": round(r["p50_ms"], 3), "reference_ms": round(r["reference_ms"], 3)}
+                       for r in results}, f, indent=4)
+        print(f"已更新基準：{BASELINE}")
+        return
+
+    if not os.path.exists(BASELINE):
+        print("沒有基準檔，略過回歸比對（可用 --update-baseline 建立）")
+        return
+
+    if args.iterations < MIN_ITERATIONS:
+        print(f"迭代次數少於 {MIN_ITERATIONS}，略過回歸比對")
+        return
+
+    with open(BASELINE, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.threshold)
+    if regressions:
+        # 單次量測可能碰上磁碟或排程的雜訊：整組重跑一次，兩次都退步的情境才算
+        print(f"{', '.join(regressions)} 超過門檻，重新量測確認...")
+        again = find_regressions(asyncio.run(run_suite(args.iterations)), baseline, args.threshold)
+        regressions = {case: again[case] for case in regressions if case in again}
+    if regressions:
+        print("效能退步：\n  " + "\n  ".join(regressions.values()))
+        sys.exit(1)
+    print("沒有超過門檻的退步")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Response cog 壓力測試：以合成訊息流驅動 on_message
+
+不連 gateway；用替身訊息/頻道（只記錄 send）以固定速率（open-loop）送進 on_message，回報：
+  - 實際吞吐量（messages/sec）
+  - 處理延遲 p50 / p99（從排定時間到 on_message 結束，含排隊等待）
+  - 事件迴圈延遲（監控 task 每 10ms 醒來一次的超時量）
+  - 記憶體（RSS 峰值；加 --tracemalloc 可看 Python 配置峰值，但會變慢。
+    Windows 沒有 resource 模組，量不到 RSS，自動改用 tracemalloc）
+
+範例：
+  python bench/load_response.py --rate 2000 --duration 10 --keywords 5000
+  python bench/load_response.py --rate 500 --keywords 50000 --length-mean 200 --hit-rate 0.3
+"""
+import argparse, asyncio, atexit, json, os, random, shutil, statistics, string, sys, tempfile, time, tracemalloc
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 資料庫與聊天紀錄放到暫存目錄，不碰正式資料
+TMP = tempfile.mkdtemp(prefix="toki-load-")
+atexit.register(shutil.rmtree, TMP, ignore_errors=True)
+os.environ["RESPONSES_DB"] = os.path.join(TMP, "responses.db")
+os.environ["CHAT_LOG_FILE"] = os.path.join(TMP, "chat.jsonl")
+
+import responses
+from chat_log import start_chat_logging, stop_chat_logging
+from outbound import OutboundScheduler
+
+ALPHABET = string.ascii_lowercase + "一二三四五六七八九十早安晚安午餐"
+GUILD_ID = 1
+
+
+class RecordingChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.name = f"load-{channel_id}"
+        self.sent = 0
+
+    async def send(self, **kwargs):
+        self.sent += 1
+
+
+class FakeBot:
+    def __init__(self):
+        self.outbound = OutboundScheduler()
+
+    async def process_commands(self, message):
+        return None
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(length))
+
+
+def build_messages(args, keywords: list[str], channels: list[RecordingChannel]) -> list:
+    rng = random.Random(args.seed)
+    guild = SimpleNamespace(id=GUILD_ID, name="load-test")
+    author = SimpleNamespace(bot=False, name="tester")
+    messages = []
+    for _ in range(int(args.rate * args.duration)):
+        length = max(1, int(rng.lognormvariate(0, args.length_sigma) * args.length_mean))
+        text = random_text(rng, length)
+        if keywords and rng.random() < args.hit_rate:
+            pos = rng.randint(0, len(text))
+            text = text[:pos] + rng.choice(keywords) + text[pos:]
+        messages.append(SimpleNamespace(
+            author=author, guild=guild, channel=rng.choice(channels), content=text, attachments=[],
+        ))
+    return messages
+
+
+async def monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - t0 - interval) * 1000)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    keywords = list(dict.fromkeys(random_text(rng, rng.randint(3, 8)) for _ in range(args.keywords)))
+
+    bot = FakeBot()
+    cog = responses.Response(bot)
+    listener = start_chat_logging()
+    await cog.store.open()
+
+    # 透過一次性遷移的公開 API 匯入關鍵字表
+    seed_path = os.path.join(TMP, "seed.json")
+    with open(seed_path, "w", encoding="utf-8") as f:
+        json.dump({k: f"reply-{i}" for i, k in enumerate(keywords)}, f, ensure_ascii=False)
+    await cog.store.migrate_json(seed_path, [GUILD_ID])
+    await cog.store.get(GUILD_ID)  # 先載入，量的是穩定狀態
+
+    channels = [RecordingChannel(100 + i) for i in range(args.channels)]
+    messages = build_messages(args, keywords, channels)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    latencies: list[float] = []
+    lag: list[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+
+    async def handle(message, scheduled: float):
+        await cog.on_message(message)
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+
+    tasks = []
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        scheduled = start + i / args.rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(handle(message, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await monitor
+    py_peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024 if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    await bot.outbound.close()
+    await cog.store.close()
+    stop_chat_logging(listener)
+
+    return {
+        "messages": len(messages),
+        "throughput": len(messages) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p99": percentile(latencies, 99),
+        "lag_p50": statistics.median(lag) if lag else 0.0,
+        "lag_max": max(lag, default=0.0),
+        "sends": sum(c.sent for c in channels),
+        "outbound": bot.outbound.stats(),
+        "rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None,
+        "py_peak_mib": py_peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=1000, help="每秒送入幾則訊息")
+    parser.add_argument("--duration", type=float, default=5, help="秒")
+    parser.add_argument("--keywords", type=int, default=1000, help="關鍵字表大小")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--length-mean", type=float, default=60, help="訊息長度（lognormal 的尺度）")
+    parser.add_argument("--length-sigma", type=float, default=0.8)
+    parser.add_argument("--hit-rate", type=float, default=0.1, help="含關鍵字的訊息比例")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tracemalloc", action="store_true")
+    args = parser.parse_args()
+    if resource is None:
+        args.tracemalloc = True  # 沒有 RSS 可看，至少回報 Python 配置峰值
+
+    r = asyncio.run(run(args))
+    print(f"messages      {r['messages']}")
+    print(f"throughput    {r['throughput']:.0f} msg/s (target {args.rate:g})")
+    print(f"latency       p50 {r['p50']:.2f} ms   p99 {r['p99']:.2f} ms")
+    print(f"loop lag      p50 {r['lag_p50']:.2f} ms   max {r['lag_max']:.2f} ms")
+    print(f"sends         {r['sends']}   outbound {r['outbound']}")
+    memory = []
+    if r["rss_mib"] is not None:
+        memory.append(f"rss peak {r['rss_mib']:.1f} MiB")
+    if r["py_peak_mib"] is not None:
+        memory.append(f"python peak {r['py_peak_mib']:.1f} MiB")
+    print(f"memory        {'   '.join(memory)}")
+
+
+if __name__ == "__main__":
+    main()
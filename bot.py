@@ -1,21 +1,81 @@
+import time
+STARTED_AT = time.perf_counter()  # 啟動計時從 import 之前開始
+
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
-import os
+from outbound import OutboundScheduler
+from metrics import MetricsServer, METRICS_PORT
+from sharding import SHARDED, SHARD_COUNT, SHARD_IDS, IS_PRIMARY
+import hashlib, json, os
 
 # 加載 .env 文件中的 TOKEN
 load_dotenv()
 TOKEN = os.getenv("TOKEN")  # 確保 .env 文件中設置了 TOKEN
 GUILD_ID = os.getenv("GUILD_ID")  # 適用於特定伺服器指令
+TREE_HASH_FILE = os.getenv("TREE_HASH_FILE", os.path.join(".cache", "command_tree.json"))
+FORCE_TREE_SYNC = os.getenv("FORCE_TREE_SYNC", "0") == "1"  # 忽略 hash，每次啟動都同步
+
+def tree_hash(tree: discord.app_commands.CommandTree, guild: discord.abc.Snowflake | None) -> str:
+    """與 tree.sync() 送出的內容相同的 payload 做 hash；指令沒變時 hash 就不變"""
+    payload = [cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def load_tree_hashes() -> dict:
+    try:
+        with open(TREE_HASH_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_tree_hashes(hashes: dict):
+    os.makedirs(os.path.dirname(TREE_HASH_FILE) or ".", exist_ok=True)
+    tmp_path = f"{TREE_HASH_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, indent=2)
+    os.replace(tmp_path, TREE_HASH_FILE)
+
+# 設定 SHARD_COUNT 時改用 AutoShardedBot（可再以 SHARD_IDS 把 shard 分給多個程序）
+BotBase = commands.AutoShardedBot if SHARDED else commands.Bot
+SHARD_OPTIONS = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARDED else {}
 
 # Bot 設定
-class MyBot(commands.Bot):
+class MyBot(BotBase):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True
-        super().__init__(command_prefix="/", intents=intents, help_command=None)
+        super().__init__(command_prefix="/", intents=intents, help_command=None, **SHARD_OPTIONS)
+        # 關鍵字回覆與新聞共用的發送佇列（依頻道限速、回覆優先）
+        self.outbound = OutboundScheduler()
+        self.metrics_server = MetricsServer(self) if METRICS_PORT else None
+        # 啟動各階段耗時（import → 登入 → 載入擴展 → 同步指令 → 連上 gateway）
+        self.startup_phases: list[tuple[str, float]] = []
+        self._phase_started = STARTED_AT
+        self._startup_reported = False
+        self.mark_phase("import")
+
+    def mark_phase(self, name: str):
+        now = time.perf_counter()
+        self.startup_phases.append((name, now - self._phase_started))
+        self._phase_started = now
+
+    async def sync_tree(self, guild: discord.abc.Snowflake | None, force: bool = False) -> bool:
+        """指令內容跟上次同步時一樣就略過（sync 是有速率限制的 REST 呼叫）；回傳是否有同步"""
+        key = f"{self.application_id}:{guild.id if guild else 'global'}"
+        digest = tree_hash(self.tree, guild)
+        hashes = load_tree_hashes()
+        if not force and hashes.get(key) == digest:
+            return False
+        await self.tree.sync(guild=guild)
+        hashes[key] = digest
+        try:
+            save_tree_hashes(hashes)
+        except OSError as e:
+            print(f"無法寫入 {TREE_HASH_FILE}：{e}")
+        return True
 
     async def setup_hook(self):
+        self.mark_phase("login")
         try:
             print("正在初始化 CommandTree...")
             if not hasattr(self, "tree"):
@@ -29,25 +89,49 @@ class MyBot(commands.Bot):
             # await self.load_extension("news_links")   //其實這邊沒有指令，所以無需去加載
 
             print("已成功加載 extension 擴展！")
+            self.mark_phase("extensions")
 
-            # 確保指令同步
+            # 確保指令同步（多程序分片時只由負責 shard 0 的程序同步）
             print("正在同步指令...")
             guild_id = os.getenv("GUILD_ID")
             guild = discord.Object(id=int(guild_id)) if guild_id else None
-            await self.tree.sync(guild=guild)
-            print(f"指令已同步到 {'伺服器: ' + guild_id if guild else '全域範圍'}")
+            if not IS_PRIMARY:
+                print("由負責 shard 0 的程序同步指令，略過")
+            elif await self.sync_tree(guild, force=FORCE_TREE_SYNC):
+                print(f"指令已同步到 {'伺服器: ' + guild_id if guild else '全域範圍'}")
+            else:
+                print("指令沒有變動，略過同步")
+            self.mark_phase("sync")
 
         except Exception as e:
             print(f"初始化時發生錯誤：{e}")
 
+        # fly.toml 的 internal_port：/healthz 與 /metrics
+        if self.metrics_server is not None:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                print(f"無法啟動 metrics 服務：{e}")
+
             
         @bot.command(name="sync",help="手動同步 Slash 指令到 Discord(開發者用)", description="手動同步 Slash 指令到 Discord(開發者用)")
         @commands.is_owner()
         async def sync(ctx):
-            await bot.tree.sync()
+            await bot.sync_tree(None, force=True)
             await ctx.send("Slash commands 已同步！")
 
+    async def on_ready(self):
+        if self._startup_reported:
+            return  # 斷線重連也會觸發 on_ready，只回報第一次
+        self._startup_reported = True
+        self.mark_phase("ready")
+        report = "、".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_phases)
+        print(f"啟動完成，共 {time.perf_counter() - STARTED_AT:.2f}s（{report}）")
+
     async def close(self):
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.outbound.close()
         await super().close()
         print("機器人已關閉")
 
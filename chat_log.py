@@ -0,0 +1,86 @@
+import json, logging, os, queue, random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from sharding import state_path
+
+CHAT_LOG_FILE = state_path(os.getenv("CHAT_LOG_FILE", os.path.join("logs", "chat.jsonl")))  # 多程序時各寫各的檔
+CHAT_LOG_MAX_BYTES = int(os.getenv("CHAT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+CHAT_LOG_BACKUPS = int(os.getenv("CHAT_LOG_BACKUPS", "5"))
+CHAT_LOG_CONSOLE = os.getenv("CHAT_LOG_CONSOLE", "0") == "1"  # 同時輸出到終端機
+CHAT_LOG_SAMPLE_RATE = float(os.getenv("CHAT_LOG_SAMPLE_RATE", "1"))  # 0 = 關閉，1 = 全部記錄
+CHAT_LOG_GUILD_RATES = os.getenv("CHAT_LOG_GUILD_RATES", "")  # 例："123:0.1,456:0"
+
+chat_logger = logging.getLogger("toki.chat")
+chat_logger.propagate = False  # 不走 root 的 basicConfig 輸出
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """一筆紀錄一行 JSON；在 listener thread 上執行，不佔用事件迴圈"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {"ts": round(record.created, 3)}
+        data.update(getattr(record, "chat", {}))
+        return json.dumps(data, ensure_ascii=False)
+
+
+def parse_guild_rates(raw: str) -> dict[int, float]:
+    rates = {}
+    for part in raw.split(","):
+        guild_id, sep, rate = part.strip().partition(":")
+        if not sep:
+            continue
+        try:
+            rates[int(guild_id)] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            logging.warning(f"CHAT_LOG_GUILD_RATES 格式錯誤：{part}")
+    return rates
+
+
+class ChatLogSampler:
+    """決定某則訊息要不要記錄；每個伺服器可以有自己的取樣率（0 表示不記錄）"""
+
+    __slots__ = ("default_rate", "guild_rates")
+
+    def __init__(self, default_rate: float = 1.0, guild_rates: dict[int, float] | None = None):
+        self.default_rate = default_rate
+        self.guild_rates = guild_rates or {}
+
+    def should_log(self, guild_id: int) -> bool:
+        rate = self.guild_rates.get(guild_id, self.default_rate)
+        if rate >= 1.0:
+            return True
+        return rate > 0.0 and random.random() < rate
+
+
+def start_chat_logging() -> QueueListener:
+    """訊息紀錄改走 QueueHandler：熱路徑只把 record 放進佇列，格式化與寫檔交給背景 thread"""
+    handlers: list[logging.Handler] = []
+    log_dir = os.path.dirname(CHAT_LOG_FILE)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        CHAT_LOG_FILE, maxBytes=CHAT_LOG_MAX_BYTES, backupCount=CHAT_LOG_BACKUPS, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonLinesFormatter())
+    handlers.append(file_handler)
+    if CHAT_LOG_CONSOLE:
+        console = logging.StreamHandler()
+        console.setFormatter(JsonLinesFormatter())
+        handlers.append(console)
+
+    log_queue = queue.SimpleQueue()
+    chat_logger.handlers.clear()
+    chat_logger.addHandler(QueueHandler(log_queue))
+    chat_logger.setLevel(logging.INFO)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=False)
+    listener.start()
+    return listener
+
+
+def stop_chat_logging(listener: QueueListener | None):
+    if listener is None:
+        return
+    listener.stop()  # 會先把佇列中剩下的紀錄寫完
+    for handler in listener.handlers:
+        handler.close()
+    chat_logger.handlers.clear()
@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+
+
+class CooldownTracker:
+    """自動回覆的冷卻狀態：key -> (上次觸發時間, 當時的冷卻秒數)
+
+    判斷時以「目前」設定的秒數與上次觸發時間比較，調短冷卻立即生效；
+    記下的秒數只用來判斷何時可以淘汰。
+
+    以 LRU + TTL 保存，筆數固定上限 max_entries；過期的項目在每次檢查時順手清掉，
+    即使有上百萬個 (頻道 × 關鍵字) 組合，記憶體也不會超過上限。
+    """
+
+    __slots__ = ("max_entries", "_fired")
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._fired: OrderedDict[tuple, tuple[float, float]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._fired)
+
+    def allow(self, key: tuple, seconds: float) -> bool:
+        """冷卻中回傳 False；否則開始新的冷卻並回傳 True"""
+        now = time.monotonic()
+        fired = self._fired.get(key)
+        if fired is not None and now - fired[0] < seconds:
+            return False
+
+        self._fired[key] = (now, seconds)
+        self._fired.move_to_end(key)
+        self._prune(now)
+        return True
+
+    def _prune(self, now: float):
+        items = self._fired
+        # 最前面是最久沒觸發的；過期或超過上限就移除（每次最多清幾筆，保持 O(1) 攤銷）
+        for _ in range(8):
+            if not items:
+                break
+            key, (fired_at, seconds) = next(iter(items.items()))
+            if fired_at + seconds > now and len(items) <= self.max_entries:
+                break
+            items.popitem(last=False)
+        while len(items) > self.max_entries:
+            items.popitem(last=False)
+
+    def clear(self, prefix: tuple | None = None, last=None):
+        """清除冷卻狀態；prefix 例如 (guild_id,) 只清該伺服器，last 再限定 key 的最後一項（例如關鍵字）"""
+        if prefix is None and last is None:
+            self._fired.clear()
+            return
+        n = len(prefix or ())
+        for key in [k for k in self._fired if k[:n] == (prefix or ()) and (last is None or k[-1] == last)]:
+            del self._fired[key]
@@ -0,0 +1,195 @@
+"""新聞頁面的輕量抽取函式
+
+只解析需要的節點，不建整棵 BeautifulSoup 樹；全部是 module-level 純函式，
+可以直接丟進 ProcessPoolExecutor 執行（參數與回傳值都能 pickle）。
+feedparser / lxml 很重（import 約 0.1 秒），第一次解析時才載入，不拖慢啟動。
+"""
+import re
+from urllib.parse import urljoin, urlparse
+
+TIME_RE = re.compile(r"\b(\d{1,2}:\d{2})\b")
+ISO_TIME_RE = re.compile(r"T(\d{2}:\d{2})")
+RFC822_TIME_RE = re.compile(r" (\d{2}:\d{2})(?::\d{2})? ")  # RSS pubDate，保留網站的當地時間
+IMG_SRC_RE = re.compile(r"""<img[^>]+src=["']([^"']+)["']""", re.I)
+# lazy-load 的佔位圖（真正的圖在 data-src / srcset）
+PLACEHOLDER_RE = re.compile(r"^data:|blank\.|spacer\.|placeholder|lazy[-_]?load|/loading\.|1x1", re.I)
+LAZY_ATTRS = ("data-src", "data-original", "data-lazy-src", "data-lazy")
+CHUNK = 16 * 1024
+
+
+def clean_url(u: str | None, base: str) -> str | None:
+    if not u:
+        return None
+    u = u.strip()
+    if u.startswith("//"):
+        u = "https:" + u
+    if not u.startswith("http"):
+        u = urljoin(base, u)
+    parsed = urlparse(u)
+    if parsed.scheme not in ("http", "https"):
+        return None
+    return u
+
+
+def best_srcset(srcset: str) -> str | None:
+    """srcset 裡寬度（w）或倍率（x）最大的網址"""
+    best, best_size = None, -1.0
+    for candidate in srcset.split(","):
+        parts = candidate.split()
+        if not parts:
+            continue
+        size = 1.0
+        if len(parts) > 1 and parts[1][:-1].replace(".", "", 1).isdigit():
+            size = float(parts[1][:-1])
+        if size > best_size:
+            best, best_size = parts[0], size
+    return best
+
+
+def pick_image(img, base: str) -> str | None:
+    """從 <img> 找真正的圖片網址：data-src 等 lazy-load 屬性 > srcset 最大的 > src，略過佔位圖"""
+    if img is None:
+        return None
+    candidates = [img.get(attr) for attr in LAZY_ATTRS]
+    for attr in ("data-srcset", "srcset"):
+        if img.get(attr):
+            candidates.append(best_srcset(img.get(attr)))
+    candidates.append(img.get("src"))
+    for candidate in candidates:
+        if candidate and not PLACEHOLDER_RE.search(candidate.strip()):
+            url = clean_url(candidate, base)
+            if url:
+                return url
+    return None
+
+
+def _has_class(cls: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+
+# ---------- LTN ----------
+def extract_ltn_feed(xml: str, limit: int) -> list[tuple]:
+    """RSS 只取前 limit 筆的 (link, title, time, image)；圖片取自 media/enclosure 或描述裡的 <img>"""
+    import feedparser
+    feed = feedparser.parse(xml)
+    items = []
+    for e in feed.entries[:limit]:
+        if not e.get("link"):
+            continue
+        m = RFC822_TIME_RE.search(e.get("published", ""))
+        image = None
+        for media in e.get("media_content", []) + e.get("media_thumbnail", []) + e.get("enclosures", []):
+            if media.get("url") and media.get("type", "image/").startswith("image/"):
+                image = clean_url(media["url"], e.link)
+                break
+        if image is None:
+            m_img = IMG_SRC_RE.search(e.get("description", ""))
+            image = clean_url(m_img.group(1), e.link) if m_img and not PLACEHOLDER_RE.search(m_img.group(1)) else None
+        items.append((e.link, e.title, m.group(1) if m else None, image))
+    return items
+
+
+def extract_ltn_article(page: str, url: str, fallback_title: str):
+    """文章頁只要 <h1>、article:published_time 與 og:image：
+    用 pull parser 逐塊餵入，三個都拿到就停止，不解析剩下的內文"""
+    from lxml import etree
+    parser = etree.HTMLPullParser(events=("end",), tag=("meta", "h1"))
+    title = time_str = img_url = None
+    seen_time = seen_img = False
+
+    for start in range(0, len(page), CHUNK):
+        parser.feed(page[start:start + CHUNK])
+        for _, el in parser.read_events():
+            if el.tag == "h1":
+                if title is None:
+                    title = "".join(el.itertext()).strip()
+            else:
+                prop = el.get("property")
+                if prop == "article:published_time" and not seen_time:
+                    seen_time = True
+                    m = ISO_TIME_RE.search(el.get("content") or "")
+                    time_str = m.group(1) if m else None
+                elif prop == "og:image" and not seen_img:
+                    seen_img = True
+                    img_url = clean_url(el.get("content"), url)
+        if title is not None and seen_time and seen_img:
+            break
+    parser.close()
+    return title or fallback_title, time_str, img_url
+
+
+# ---------- TVBS ----------
+def extract_tvbs(page: str, limit: int, base: str) -> list[tuple]:
+    from lxml import html as lxml_html
+    doc = lxml_html.fromstring(page)
+    items = []
+    for li in doc.xpath(f"//li[{_has_class('news_list')}]")[:limit]:
+        links = li.xpath(".//h2//a")
+        if not links:
+            continue
+        a = links[0]
+        title = a.text_content().strip()
+        url = urljoin(base, a.get("href", ""))
+
+        time_str = None
+        tnodes = li.xpath(f".//*[{_has_class('time')}]")
+        if tnodes:
+            m = TIME_RE.search(" ".join(tnodes[0].text_content().split()))
+            time_str = m.group(1) if m else None
+
+        imgs = li.xpath(".//img")
+        image = pick_image(imgs[0], base) if imgs else None
+        items.append((time_str, title, url, image))
+    return items
+
+
+# ---------- ETtoday ----------
+def extract_ettoday(page: str, limit: int, base: str) -> list[tuple]:
+    from lxml import html as lxml_html
+    doc = lxml_html.fromstring(page)
+    items = []
+    for h3 in doc.xpath(f"//div[{_has_class('part_list_2')}]//h3")[:limit]:
+        links = h3.xpath(".//a")
+        if not links:
+            continue
+        a = links[0]
+        title = a.text_content().strip()
+        url = urljoin(base, a.get("href", ""))
+
+        time_str = None
+        dates = h3.xpath(f".//span[{_has_class('date')}]")
+        if dates:
+            m = TIME_RE.search(" ".join(dates[0].text_content().split()))
+            time_str = m.group(1) if m else None
+
+        # 圖片：版面不一定有，盡量抓（h3 前面最近的 <a> 裡的 <img>）
+        image = None
+        sib_a = h3.xpath("preceding-sibling::a[1]")
+        if sib_a:
+            imgs = sib_a[0].xpath(".//img")
+            image = pick_image(imgs[0], base) if imgs else None
+        items.append((time_str, title, url, image))
+    return items
+
+
+# ---------- Reddit（r/Games） ----------
+def extract_reddit(page: str, limit: int) -> list[tuple]:
+    """只看 <shreddit-post> 的屬性；前 limit 個 post 看完就停止解析"""
+    from lxml import etree
+    parser = etree.HTMLPullParser(events=("start",), tag="shreddit-post")
+    posts = []
+    for start in range(0, len(page), CHUNK):
+        parser.feed(page[start:start + CHUNK])
+        posts.extend(el for _, el in parser.read_events())
+        if len(posts) >= limit:
+            break
+
+    items = []
+    for el in posts[:limit]:
+        title = el.get("post-title") or el.get("data-adclicktitle")
+        url = el.get("content-href") or el.get("permalink")
+        if not title or not url:
+            continue
+        items.append((None, title, url, clean_url(el.get("thumbnail-url"), url)))
+    parser.close()
+    return items
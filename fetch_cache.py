@@ -0,0 +1,156 @@
+import asyncio, hashlib, json, logging, os, threading, time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+
+@dataclass
+class CacheEntry:
+    etag: str | None
+    last_modified: str | None
+    stored_at: float
+    used_at: float
+    size: int
+
+    @property
+    def version(self) -> tuple:
+        """同一個 URL 的內容版本；304 時不變"""
+        return (self.etag, self.last_modified, self.stored_at)
+
+
+class FetchCache:
+    """新聞來源共用的 HTTP 快取
+
+    - 以 ETag / Last-Modified 做條件式請求（If-None-Match / If-Modified-Since）
+    - 回應內容存在磁碟，超過 ttl 沒被用到或總容量超過 max_bytes 時以 LRU 淘汰
+    - 索引在記憶體（依使用順序排列），磁碟寫入交給 worker thread
+    """
+
+    def __init__(self, directory: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0    # 304，直接沿用快取
+        self.misses = 0  # 200，重新下載
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._index_path = os.path.join(directory, "index.json")
+        self._write_lock = threading.Lock()  # 多個 worker thread 同時寫索引時避免暫存檔互蓋
+        self._load_index()
+
+    # ---------- 索引 ----------
+    def _load_index(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for url, data in sorted(raw.items(), key=lambda kv: kv[1].get("used_at", 0)):
+            try:
+                entry = CacheEntry(**data)
+            except TypeError:
+                continue
+            if os.path.exists(self._body_path(url)):
+                self._entries[url] = entry
+                self.total_bytes += entry.size
+
+    def _save_index(self, snapshot: dict):
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _body_path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    # ---------- 查詢 ----------
+    def entry(self, url: str) -> CacheEntry | None:
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        if time.time() - entry.used_at > self.ttl:
+            self.drop(url)
+            return None
+        return entry
+
+    def validators(self, url: str) -> dict[str, str]:
+        """組出條件式請求需要的 header"""
+        entry = self.entry(url)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def read(self, url: str) -> str:
+        """讀取磁碟上的內容（請在 worker thread 呼叫）"""
+        with open(self._body_path(url), "r", encoding="utf-8") as f:
+            return f.read()
+
+    # ---------- 更新 ----------
+    def touch(self, url: str):
+        """收到 304：更新使用時間並移到 LRU 尾端"""
+        entry = self._entries.get(url)
+        if entry is not None:
+            entry.used_at = time.time()
+            self._entries.move_to_end(url)
+            self.hits += 1
+
+    async def store(self, url: str, body: str, etag: str | None, last_modified: str | None) -> CacheEntry:
+        self.misses += 1
+        now = time.time()
+        old = self._entries.pop(url, None)
+        if old is not None:
+            self.total_bytes -= old.size
+        entry = CacheEntry(etag, last_modified, now, now, len(body.encode("utf-8")))
+        if etag or last_modified:
+            # 沒有驗證資訊的回應無法做條件式請求，就不佔磁碟
+            self._entries[url] = entry
+            self.total_bytes += entry.size
+            evicted = self._evict()
+            snapshot = {u: asdict(e) for u, e in self._entries.items()}
+            try:
+                await asyncio.to_thread(self._write, url, body, evicted, snapshot)
+            except OSError as e:
+                logging.warning(f"寫入 HTTP 快取失敗：{e}")
+                self.drop(url)  # 沒有內容可讀，就不能再送驗證資訊換 304
+        return entry
+
+    def _write(self, url: str, body: str, evicted: list[str], snapshot: dict):
+        with self._write_lock:
+            self._write_locked(url, body, evicted, snapshot)
+
+    def _write_locked(self, url: str, body: str, evicted: list[str], snapshot: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._body_path(url), "w", encoding="utf-8") as f:
+            f.write(body)
+        for old_url in evicted:
+            try:
+                os.remove(self._body_path(old_url))
+            except FileNotFoundError:
+                pass
+        self._save_index(snapshot)
+
+    def _evict(self) -> list[str]:
+        """超過容量時從最久沒用的開始淘汰，回傳被淘汰的 URL"""
+        evicted = []
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            url, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.size
+            evicted.append(url)
+        return evicted
+
+    def drop(self, url: str):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+            try:
+                os.remove(self._body_path(url))
+            except OSError:
+                pass
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
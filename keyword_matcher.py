@@ -0,0 +1,86 @@
+from collections import deque
+from typing import Iterable
+
+
+class KeywordMatcher:
+    """Aho-Corasick 多關鍵字比對器。
+
+    以關鍵字表建立一次自動機，之後每則訊息只需掃過一次字元，
+    成本與關鍵字數量無關。多個關鍵字同時命中時，回傳「設定順序最前面」的那一個，
+    與原本 `for keyword in responses: if keyword in text: break` 的行為一致。
+    """
+
+    __slots__ = ("_goto", "_fail", "_best", "_keywords", "_empty")
+
+    def __init__(self, keywords: Iterable[str] = ()):
+        self._keywords: list[str] = []
+        # 每個節點：字元 -> 子節點
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # 每個節點（含 fail 鏈上的所有輸出）中，優先序最小的關鍵字 index；-1 表示無
+        self._best: list[int] = [-1]
+        # 空字串關鍵字（`"" in text` 永遠成立）的優先序；-1 表示無
+        self._empty = -1
+        self._build(keywords)
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def _build(self, keywords: Iterable[str]):
+        goto, best = self._goto, self._best
+        for keyword in keywords:
+            priority = len(self._keywords)
+            self._keywords.append(keyword)
+            if not keyword:
+                if self._empty == -1:
+                    self._empty = priority
+                continue
+            node = 0
+            for ch in keyword:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    self._fail.append(0)
+                    best.append(-1)
+                node = nxt
+            if best[node] == -1:
+                best[node] = priority  # 重複關鍵字保留第一個
+
+        # BFS 建立 fail 連結，同時把 fail 鏈上的最佳優先序往下合併
+        fail = self._fail
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[child] = target if target != child else 0
+                inherited = best[fail[child]]
+                if inherited != -1 and (best[child] == -1 or inherited < best[child]):
+                    best[child] = inherited
+                queue.append(child)
+
+    def match(self, text: str) -> str | None:
+        """回傳 text 中命中、且設定順序最前的關鍵字；沒有命中回傳 None。"""
+        if not self._keywords:
+            return None
+
+        goto, fail, best = self._goto, self._fail, self._best
+        found = self._empty
+        if found == 0:
+            return self._keywords[0]
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = best[node]
+            if hit != -1 and (found == -1 or hit < found):
+                found = hit
+                if found == 0:
+                    break  # 已是最高優先序，不必再掃
+        return self._keywords[found] if found != -1 else None
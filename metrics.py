@@ -0,0 +1,225 @@
+import asyncio, logging, math, os, time
+from bisect import bisect_left
+from aiohttp import web
+from sharding import MULTI_PROCESS, SHARD_IDS
+
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8080"))  # fly.toml 的 internal_port；0 = 不啟動
+if MULTI_PROCESS and METRICS_PORT:
+    METRICS_PORT += SHARD_IDS[0]  # 多程序分片：每個程序各自一個 port（例：SHARD_IDS=4-7 → 8084）
+LOOP_PROBE_INTERVAL = float(os.getenv("METRICS_LOOP_PROBE_INTERVAL", "0.5"))     # 秒
+LOOP_BLOCK_THRESHOLD = float(os.getenv("METRICS_LOOP_BLOCK_THRESHOLD", "0.1"))   # 秒，超過視為阻塞
+
+_registry: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _Callback:
+    """給了 func 時在每次輸出時才呼叫取值，不用在熱路徑上更新"""
+
+    def _read(self):
+        try:
+            return self.func()
+        except Exception as e:
+            logging.warning(f"讀取指標 {self.name} 失敗: {e}")
+            return None
+
+
+class Counter(_Metric, _Callback):
+    """只增不減的計數；也可以用 func 直接讀其他物件上的計數器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), func=None):
+        super().__init__(name, help, labelnames)
+        self.func = func
+        self.values: dict[tuple, float] = {} if labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def collect(self) -> list[str]:
+        if self.func is not None:
+            value = self._read()
+            return [] if value is None else [f"{self.name} {_number(value)}"]
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in self.values.items()]
+
+
+class Gauge(_Metric, _Callback):
+    """目前值"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, func=None):
+        super().__init__(name, help)
+        self.func = func
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def collect(self) -> list[str]:
+        value = self.value if self.func is None else self._read()
+        return [] if value is None else [f"{self.name} {_number(value)}"]
+
+
+class Histogram(_Metric):
+    """固定 bucket 的直方圖；observe 只做一次 bisect 與幾個加法"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple, labelnames: tuple = ()):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values: dict[tuple, list] = {}  # labels -> [各 bucket 次數..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        data = self.values.get(key)
+        if data is None:
+            data = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        i = bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            data[i] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def collect(self) -> list[str]:
+        lines = []
+        for key, data in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {data[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(data[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {data[-1]}")
+        return lines
+
+
+def render() -> str:
+    """Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        samples = metric.collect()
+        if samples:
+            lines.extend(metric.header())
+            lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+# ---------- 各模組共用的指標 ----------
+ON_MESSAGE_SECONDS = Histogram(
+    "toki_on_message_seconds", "Time spent handling one message in the keyword responder",
+    (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+KEYWORD_HITS = Counter("toki_keyword_hits_total", "Messages that matched a keyword", ("result",))
+NEWS_FETCH_SECONDS = Histogram(
+    "toki_news_fetch_seconds", "Duration of one news source fetch",
+    (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0), ("source",),
+)
+NEWS_FETCH_ERRORS = Counter("toki_news_fetch_errors_total", "News source fetches that raised", ("source",))
+LOOP_LAG = Gauge("toki_event_loop_lag_seconds", "Last measured event loop scheduling delay")
+LOOP_BLOCKS = Counter("toki_event_loop_blocks_total", "Event loop stalls longer than the blocking threshold")
+
+
+class MetricsServer:
+    """/healthz 與 /metrics 的 aiohttp 服務，並在背景量測事件迴圈延遲"""
+
+    def __init__(self, bot, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.loop_lag = 0.0
+        self.started_at = time.monotonic()
+        self._runner: web.AppRunner | None = None
+        self._probe: asyncio.Task | None = None
+        Gauge("toki_gateway_latency_seconds", "Discord gateway heartbeat latency", lambda: bot.latency)
+        Gauge("toki_outbound_queue_depth", "Messages waiting in the outbound send queue", lambda: bot.outbound.depth)
+        Counter("toki_outbound_sent_total", "Messages sent by the outbound queue", func=lambda: bot.outbound.sent)
+        Counter("toki_outbound_dropped_total", "Replies dropped because a channel backlog was full",
+                func=lambda: bot.outbound.dropped)
+        Gauge("toki_outbound_max_wait_seconds", "Longest time a message waited in the outbound queue",
+              lambda: bot.outbound.max_wait)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/healthz", self.healthz)
+        app.router.add_get("/metrics", self.metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._probe = asyncio.create_task(self._probe_loop())
+        logging.info(f"metrics 服務已啟動：http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _probe_loop(self):
+        """睡固定時間，實際多睡的部分就是事件迴圈被佔住的時間"""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_PROBE_INTERVAL)
+            self.loop_lag = max(0.0, time.perf_counter() - started - LOOP_PROBE_INTERVAL)
+            LOOP_LAG.set(self.loop_lag)
+            if self.loop_lag > LOOP_BLOCK_THRESHOLD:
+                LOOP_BLOCKS.inc()
+                logging.warning(f"事件迴圈被阻塞約 {self.loop_lag * 1000:.0f}ms")
+
+    def connected(self) -> bool:
+        return self.bot.is_ready() and not self.bot.is_closed() and math.isfinite(self.bot.latency)
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        connected = self.connected()
+        return web.json_response({
+            "status": "ok" if connected else "unavailable",
+            "gateway": "connected" if connected else "disconnected",
+            "gateway_latency_ms": round(self.bot.latency * 1000, 1) if math.isfinite(self.bot.latency) else None,
+            "loop_lag_ms": round(self.loop_lag * 1000, 1),
+            "uptime": round(time.monotonic() - self.started_at),
+        }, status=200 if connected else 503)
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=render().encode("utf-8"), headers={
+            "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+            "Cache-Control": "no-store",
+        })
@@ -1,9 +1,15 @@
-import os, discord
+import asyncio, os, time, discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from news_links import NEWS_SOURCES
+from news_links import NEWS_SOURCES, close_session, fetch_news, shutdown_parser_pool
+from seen_store import SeenStore
+from subscriptions import Subscription, SubscriptionStore, SourceSchedule
+from story_dedup import StoryIndex
+from shared_state import FetcherElection, SharedResults
+from sharding import MULTI_PROCESS, owns_guild, state_path
+from outbound import OutboundScheduler, PRIORITY_BULK
 
 load_dotenv()
 
@@ -19,6 +25,19 @@ def _env_int(*keys: str) -> int | None:
 NEWS_CHANNEL_ID  = _env_int("news_channel_id", "NEWS_CHANNEL_ID")
 GAMING_CHANNEL_ID = _env_int("game_channel_id", "GAMING_CHANNEL_ID")
 GUILD_ID = _env_int("GUILD_ID")
+SEEN_FILE = state_path(os.getenv("NEWS_SEEN_FILE", "news_seen.bin"))  # 每個程序只記自己負責的頻道
+# 已發送紀錄是每個頻道各自一份：主要靠 SEEN_MAX_AGE_DAYS 過期，數量上限依訂閱數放大，只當保險
+SEEN_MAX_ITEMS = int(os.getenv("NEWS_SEEN_MAX_ITEMS", "10000"))  # 下限
+SEEN_ITEMS_PER_SUBSCRIPTION = int(os.getenv("NEWS_SEEN_ITEMS_PER_SUBSCRIPTION", "5000"))
+SEEN_MAX_AGE_DAYS = float(os.getenv("NEWS_SEEN_MAX_AGE_DAYS", "30"))
+SUBSCRIPTIONS_FILE = os.getenv("NEWS_SUBSCRIPTIONS_FILE", "news_subscriptions.json")
+SCHEDULER_TICK = float(os.getenv("NEWS_SCHEDULER_TICK", "30"))  # 秒，多久檢查一次哪些來源到期
+DEFAULT_INTERVAL_MINUTES = 60
+STORIES_FILE = state_path(os.getenv("NEWS_STORIES_FILE", "news_stories.json"))
+DEDUP_WINDOW_HOURS = float(os.getenv("NEWS_DEDUP_WINDOW_HOURS", "48"))
+DEDUP_MAX_STORIES = int(os.getenv("NEWS_DEDUP_MAX_STORIES", "5000"))
+DEDUP_SIMILARITY = float(os.getenv("NEWS_DEDUP_SIMILARITY", "0.5"))  # 標題 shingle 的 Jaccard 相似度門檻
+SHARED_DIR = os.getenv("NEWS_SHARED_DIR", os.path.join(".cache", "shared"))  # 多程序分片時共用的抓取結果與選舉鎖
 
 def now_tz():
     return datetime.now(timezone.utc)
@@ -37,95 +56,197 @@ async def resolve_channel(bot: commands.Bot, channel_id: int | None) -> discord.
         return ch
     return None
 
+MAX_EMBEDS_PER_MESSAGE = 10          # Discord 單則訊息最多 10 個 embed
+MAX_EMBED_CHARS_PER_MESSAGE = 6000   # 單則訊息所有 embed 的文字總和上限
+
+def make_embed(item: dict, with_time: bool = True) -> discord.Embed:
+    title_text = f"{item['time']}\n{item['title']}" if with_time and item.get("time") else item["title"]
+    embed = discord.Embed(
+        title=title_text,
+        url=item["url"],
+        color=discord.Color.random(),
+        timestamp=now_tz(),
+    )
+    if item.get("image"):
+        embed.set_thumbnail(url=item["image"])
+    return embed
+
+def pack_embeds(embeds: list[discord.Embed]) -> list[list[discord.Embed]]:
+    """依序把 embed 裝進訊息，每則不超過數量與總字數上限（順序不變）"""
+    batches, batch, size = [], [], 0
+    for embed in embeds:
+        n = len(embed)
+        if batch and (len(batch) >= MAX_EMBEDS_PER_MESSAGE or size + n > MAX_EMBED_CHARS_PER_MESSAGE):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(embed)
+        size += n
+    if batch:
+        batches.append(batch)
+    return batches
+
+async def _send_batch(outbound: OutboundScheduler, channel: discord.abc.Messageable, batch: list[discord.Embed]) -> int:
+    """回傳實際送出的 embed 數（含拆半重送的部分）；小於 len(batch) 表示中途失敗"""
+    try:
+        await outbound.send(channel, PRIORITY_BULK, embeds=batch)
+        return len(batch)
+    except discord.HTTPException as e:
+        # 400 多半是整體大小超過限制：拆成兩半重送，直到單一 embed
+        if e.status != 400 or len(batch) == 1:
+            print(f"發送新聞失敗：{e}")
+            return 0
+    mid = len(batch) // 2
+    sent = await _send_batch(outbound, channel, batch[:mid])
+    if sent < mid:
+        return sent
+    return sent + await _send_batch(outbound, channel, batch[mid:])
+
+async def send_embeds(outbound: OutboundScheduler, channel: discord.abc.Messageable, embeds: list[discord.Embed]) -> int:
+    """批次發送（一則訊息最多 10 個 embed），回傳成功送出的 embed 數；失敗時停止，不打亂順序"""
+    sent = 0
+    for batch in pack_embeds(embeds):
+        delivered = await _send_batch(outbound, channel, batch)
+        sent += delivered
+        if delivered < len(batch):
+            break
+    return sent
+
+SOURCE_CHOICES = [
+    app_commands.Choice(name="LTN 即時 (ltn)", value="ltn"),
+    app_commands.Choice(name="TVBS (tvbs)", value="tvbs"),
+    app_commands.Choice(name="ETtoday (ettoday)", value="ettoday"),
+    app_commands.Choice(name="Reddit 遊戲 (reddit)", value="reddit"),
+]
+
 class NewsManager(commands.Cog):
     """處理新聞功能的 Cog"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.latest_news = set()
-        self.latest_gaming = set()
-        self.news_channel_id = NEWS_CHANNEL_ID
-        self.gaming_channel_id = GAMING_CHANNEL_ID
-
-    # ---------- Auto：LTN ----------
-    @tasks.loop(hours=1)
-    async def check_news_task(self):
-        print("check_news_task() 正在執行")
-        if not self.news_channel_id:
-            print("未設置新聞頻道 ID，跳過發送。")
+        # 已發送紀錄：固定長度雜湊、有數量/時間上限，重啟後從磁碟載回
+        self.seen = SeenStore(SEEN_FILE, max_items=SEEN_MAX_ITEMS, max_age=SEEN_MAX_AGE_DAYS * 24 * 3600)
+        # 訂閱：每個來源每次只抓一次，再分送給所有訂閱的頻道
+        # 多程序分片時檔案共用，每個程序只發送、只修改自己負責的伺服器
+        self.subscriptions = SubscriptionStore(SUBSCRIPTIONS_FILE, owns=owns_guild)
+        self.schedules: dict[str, SourceSchedule] = {}
+        # 跨來源去重：同一則新聞（網址正規化後相同或標題相近）對應到同一個故事 ID
+        self.stories = StoryIndex(STORIES_FILE, window=DEDUP_WINDOW_HOURS * 3600,
+                                  max_items=DEDUP_MAX_STORIES, similarity=DEDUP_SIMILARITY)
+        self._sending: set[str] = set()  # 正在發送中的 seen key，避免兩個來源同時送出同一則
+        # 多程序分片：只有選出的一個程序實際抓取，結果寫到共用目錄，其他程序讀取後各自發送
+        self.election = FetcherElection(os.path.join(SHARED_DIR, "fetcher.lock")) if MULTI_PROCESS else None
+        self.shared = SharedResults(SHARED_DIR) if MULTI_PROCESS else None
+        self._shared_versions: dict[str, int] = {}
+
+    # ---------- 訂閱排程 ----------
+    def sync_schedules(self):
+        """訂閱變動後更新各來源的排程：新來源立刻抓，沒人訂閱的來源停止"""
+        for source in self.subscriptions.sources():
+            base = min(s.interval for s in self.subscriptions.for_source(source))
+            if source in self.schedules:
+                self.schedules[source].rebase(base)
+            else:
+                self.schedules[source] = SourceSchedule(source, base)
+        for source in set(self.schedules) - self.subscriptions.sources():
+            del self.schedules[source]
+        owned = sum(1 for s in self.subscriptions if owns_guild(s.guild_id))
+        self.seen.max_items = max(SEEN_MAX_ITEMS, SEEN_ITEMS_PER_SUBSCRIPTION * owned)
+
+    @tasks.loop(seconds=SCHEDULER_TICK)
+    async def news_scheduler(self):
+        if MULTI_PROCESS and await self.subscriptions.reload_if_changed():
+            self.sync_schedules()  # 其他程序新增/取消的訂閱也要算進抓取排程
+        if self.election is not None and not self.election.try_acquire():
+            await self.consume_shared()
+        else:
+            now = time.monotonic()
+            due = [s for s in self.schedules.values() if s.due(now)]
+            if not due:
+                return
+            await asyncio.gather(*(self.run_source(s) for s in due))
+        await self.seen.save()
+        await self.stories.save()
+
+    async def consume_shared(self):
+        """非抓取程序：共用目錄裡有新的抓取結果時，發送到自己負責的頻道"""
+        sources = {s.source for s in self.subscriptions if owns_guild(s.guild_id)}
+        for source in sources:
+            result = await self.shared.read_new(source, self._shared_versions.get(source, 0))
+            if result is not None:
+                self._shared_versions[source], items = result
+                await self.fan_out(source, items)
+
+    async def latest_items(self, source: str) -> list[dict]:
+        """手動抓取：多程序分片時，非抓取程序沿用抓取程序最新發布的結果；
+        沒有人訂閱這個來源（沒有共用結果）時才自己抓"""
+        if self.election is not None and not self.election.is_leader:
+            result = await self.shared.read_new(source)
+            if result is not None:
+                return result[1]
+        return await fetch_news(source)
+
+    async def run_source(self, schedule: SourceSchedule):
+        """抓一次來源，依結果調整下次間隔，再分送到每個訂閱頻道"""
+        try:
+            items = await fetch_news(schedule.source)
+        except Exception as e:
+            schedule.record(None)
+            print(f"抓取 {schedule.source} 失敗（第 {schedule.errors} 次），{schedule.interval / 60:.0f} 分鐘後重試：{e}")
             return
-
-        channel = await resolve_channel(self.bot, self.news_channel_id)
+        schedule.record([item["url"] for item in items])
+        print(f"{schedule.source} 抓到 {len(items)} 則新聞，下次 {schedule.interval / 60:.0f} 分鐘後")
+        if self.shared is not None:
+            await self.shared.publish(schedule.source, items)
+        await self.fan_out(schedule.source, items)
+
+    async def fan_out(self, source: str, items: list[dict]):
+        stories = [(item, self.stories.resolve(item["url"], item["title"])) for item in items]
+        subs = self.subscriptions.for_source(source, owned=True)
+        await asyncio.gather(*(self.deliver(sub, stories) for sub in subs))
+
+    @staticmethod
+    def seen_key(channel_id: int, story_id: str) -> str:
+        return f"story:{channel_id}:{story_id}"
+
+    async def deliver(self, sub: Subscription, stories: list[tuple[dict, str]]):
+        channel = await resolve_channel(self.bot, sub.channel_id)
         if not channel:
-            print(f"找不到新聞頻道 ID：{self.news_channel_id}")
+            print(f"找不到 {sub.source} 訂閱頻道 ID：{sub.channel_id}")
             return
-
-        items = NEWS_SOURCES["ltn"]()
-        # 由舊到新發送
-        for item in reversed(items):
-            key = f"{item['title']}-{item['url']}"
-            if key in self.latest_news:
+        if not sub.guild_id and getattr(channel, "guild", None) and owns_guild(channel.guild.id):
+            sub.guild_id = channel.guild.id  # 從 env 匯入的訂閱，第一次發送時補上伺服器
+            await self.subscriptions.save()
+
+        # 由舊到新發送；同一個故事（含其他來源已送過的）在這個頻道只送一次
+        new_items, keys = [], []
+        for item, story_id in reversed(stories):
+            key = self.seen_key(sub.channel_id, story_id)
+            if key in keys or key in self.seen or key in self._sending:
                 continue
-
-            title_text = f"{item['time']}\n{item['title']}" if item["time"] else item["title"]
-            embed = discord.Embed(
-                title=title_text,
-                url=item["url"],
-                color=discord.Color.random(),
-                timestamp=now_tz()
-            )
-            if item.get("image"):
-                embed.set_thumbnail(url=item["image"])
-
-            await channel.send(embed=embed)
-            self.latest_news.add(key)
-        
-        print(f"抓到 {len(items)} 則新聞")
-        for i, item in enumerate(items, 1):
-            print(f"{i}. {item['time']} {item['title']}")
-        
-
-    # ---------- Auto：Reddit（Game） ----------
-    @tasks.loop(hours=1)
-    async def check_gaming_task(self):
-        if not self.gaming_channel_id:
-            print("未設置遊戲頻道 ID，跳過發送。")
-            return
-
-        ch = await resolve_channel(self.bot, self.gaming_channel_id)
-        if not ch:
-            print(f"找不到遊戲頻道 ID：{self.gaming_channel_id}")
-            return
-
-        items = NEWS_SOURCES["reddit"]()
-        for item in reversed(items):
-            key = f"{item['title']}-{item['url']}"
-            if key in self.latest_gaming:   # 統一用 latest_gaming
-                continue
-
-            embed = discord.Embed(
-                title=item["title"],
-                url=item["url"],
-                color=discord.Color.random(),
-                timestamp=now_tz(),
-            )
-            if item.get("image"):
-                embed.set_thumbnail(url=item["image"])
-
-            await ch.send(embed=embed)
-            self.latest_gaming.add(key)
+            new_items.append(item)
+            keys.append(key)
+        self._sending.update(keys)
+        try:
+            sent = await send_embeds(self.bot.outbound, channel, [make_embed(item) for item in new_items])
+        finally:
+            self._sending.difference_update(keys)
+        for key in keys[:sent]:
+            self.seen.add(key)
+
+    async def subscribe(self, channel: discord.TextChannel, source: str, minutes: int, replace: bool = False):
+        """replace=True 時，同伺服器中同一來源只保留這個頻道（/set_news_channel 的舊行為）"""
+        if replace:
+            for sub in self.subscriptions.for_guild(channel.guild.id):
+                if sub.source == source:
+                    self.subscriptions.remove(sub.channel_id, source)
+        self.subscriptions.add(Subscription(channel.guild.id, channel.id, source, minutes * 60.0))
+        self.sync_schedules()
+        await self.subscriptions.save()
 
     # ---------- 手動抓取 ----------
     @app_commands.command(name="fetch_latest_news", description="手動檢查新聞並發送到當前頻道")
     @app_commands.describe(source=f"選擇新聞來源（{', '.join(NEWS_SOURCES.keys())}）")  # ✅ 括號補齊
-    @app_commands.choices(
-        source=[
-            app_commands.Choice(name="LTN 即時 (ltn)", value="ltn"),
-            app_commands.Choice(name="TVBS (tvbs)", value="tvbs"),
-            app_commands.Choice(name="ETtoday (ettoday)", value="ettoday"),
-            app_commands.Choice(name="Reddit 遊戲 (reddit)", value="reddit"),
-        ]
-    )
+    @app_commands.choices(source=SOURCE_CHOICES)
     async def fetch_latest_news(self, interaction: discord.Interaction, source: app_commands.Choice[str] | None = None):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
@@ -137,18 +258,8 @@ class NewsManager(commands.Cog):
             )
             return
 
-        items = NEWS_SOURCES[src_key]()
-        for item in items:
-            title_text = f"{item['time']}\n{item['title']}" if item["time"] else item["title"]
-            embed = discord.Embed(
-                title=title_text,
-                url=item["url"],
-                color=discord.Color.random(),
-                timestamp=now_tz(),
-            )
-            if item.get("image"):
-                embed.set_thumbnail(url=item["image"])
-            await interaction.channel.send(embed=embed)
+        items = await self.latest_items(src_key)
+        await send_embeds(self.bot.outbound, interaction.channel, [make_embed(item) for item in items])
 
         await interaction.followup.send(f"已抓取 **{src_key.upper()}** 共 {len(items)} 則", ephemeral=True)
 
@@ -172,6 +283,19 @@ class NewsManager(commands.Cog):
             ),
             inline=False
         )
+        embed.add_field(
+            name="/news_subscribe",
+            value=(
+                "讓頻道訂閱任一來源，可設定抓取間隔（分鐘）。\n"
+                "範例：`/news_subscribe source: tvbs minutes: 30`"
+            ),
+            inline=False
+        )
+        embed.add_field(
+            name="/news_unsubscribe",
+            value="取消頻道的某個來源訂閱。",
+            inline=False
+        )
         embed.add_field(
             name="/set_news_channel",
             value="設定**即時新聞 (LTN)** 自動推送的頻道。",
@@ -185,52 +309,99 @@ class NewsManager(commands.Cog):
         embed.set_footer(text="提示：在輸入 /fetch_latest_news 時可直接從下拉選來源")
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    # ---------- 設定頻道 ----------
+    # ---------- 訂閱設定 ----------
+    @app_commands.command(name="news_subscribe", description="讓頻道訂閱新聞來源")
+    @app_commands.describe(source="新聞來源", minutes="抓取間隔（分鐘）", channel="推送的頻道（預設為當前頻道）")
+    @app_commands.choices(source=SOURCE_CHOICES)
+    async def news_subscribe(self, interaction: discord.Interaction, source: app_commands.Choice[str],
+                             minutes: app_commands.Range[int, 5, 1440] = DEFAULT_INTERVAL_MINUTES,
+                             channel: discord.TextChannel | None = None):
+        channel = channel or interaction.channel
+        if not isinstance(channel, discord.TextChannel):
+            await interaction.response.send_message("只能訂閱到伺服器的文字頻道", ephemeral=True)
+            return
+        await self.subscribe(channel, source.value, minutes)
+        await interaction.response.send_message(
+            f"{channel.mention} 已訂閱 **{source.value.upper()}**，每 {minutes} 分鐘檢查", ephemeral=True)
+
+    @app_commands.command(name="news_unsubscribe", description="取消頻道的新聞來源訂閱")
+    @app_commands.describe(source="新聞來源", channel="頻道（預設為當前頻道）")
+    @app_commands.choices(source=SOURCE_CHOICES)
+    async def news_unsubscribe(self, interaction: discord.Interaction, source: app_commands.Choice[str],
+                               channel: discord.TextChannel | None = None):
+        channel_id = channel.id if channel else interaction.channel_id
+        if self.subscriptions.remove(channel_id, source.value) is None:
+            await interaction.response.send_message(f"<#{channel_id}> 沒有訂閱 {source.value.upper()}", ephemeral=True)
+            return
+        self.sync_schedules()
+        await self.subscriptions.save()
+        await interaction.response.send_message(f"<#{channel_id}> 已取消訂閱 {source.value.upper()}", ephemeral=True)
+
     @app_commands.command(name="set_news_channel", description="設置自動發送新聞的頻道（LTN）")
     async def set_news_channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
-        self.news_channel_id = channel.id
+        await self.subscribe(channel, "ltn", DEFAULT_INTERVAL_MINUTES, replace=True)
         await interaction.response.send_message(f"新聞頻道已設置為：{channel.mention}", ephemeral=True)
 
     @app_commands.command(name="set_gaming_channel", description="設置自動發送遊戲的頻道（Reddit）")
     async def set_gaming_channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
-        self.gaming_channel_id = channel.id
+        await self.subscribe(channel, "reddit", DEFAULT_INTERVAL_MINUTES, replace=True)
         await interaction.response.send_message(f"遊戲頻道已設置為：{channel.mention}", ephemeral=True)
 
-    @app_commands.command(name="show_news_channels", description="顯示目前設定的新聞與遊戲頻道")
+    @app_commands.command(name="show_news_channels", description="顯示這個伺服器的新聞訂閱")
     async def show_news_channels(self, interaction: discord.Interaction):
-        """顯示目前設定的頻道狀態"""
-        news_ch = self.bot.get_channel(self.news_channel_id) if self.news_channel_id else None
-        gaming_ch = self.bot.get_channel(self.gaming_channel_id) if self.gaming_channel_id else None
-
+        """顯示目前的訂閱與各來源實際的抓取間隔"""
+        subs = self.subscriptions.for_guild(interaction.guild_id or 0)
         msg_lines = []
-        msg_lines.append(f"**新聞頻道**：{news_ch.mention if news_ch else '未設置'}")
-        msg_lines.append(f"**遊戲頻道**：{gaming_ch.mention if gaming_ch else '未設置'}")
+        for sub in sorted(subs, key=lambda s: (s.source, s.channel_id)):
+            line = f"**{sub.source.upper()}** → <#{sub.channel_id}>（每 {sub.interval / 60:.0f} 分鐘）"
+            schedule = self.schedules.get(sub.source)
+            if schedule and schedule.interval != sub.interval:
+                line += f"，目前 {schedule.interval / 60:.0f} 分鐘"
+            msg_lines.append(line)
 
         embed = discord.Embed(
-            title="當前頻道設定狀態",
-            description="\n".join(msg_lines),
+            title="當前新聞訂閱",
+            description="\n".join(msg_lines) or "未設置",
             color=discord.Color.blue(),
             timestamp=datetime.now(timezone.utc)
         )
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    @check_news_task.before_loop
-    async def before_news_task(self):
+    @news_scheduler.before_loop
+    async def before_news_scheduler(self):
         print("等待 bot 準備完成...")
         await self.bot.wait_until_ready()
         print("bot 準備完成，開始自動新聞任務")
 
+    async def load_subscriptions(self):
+        if not await self.subscriptions.load():
+            # 第一次啟動：沿用 .env 裡設定的頻道
+            for channel_id, source in ((NEWS_CHANNEL_ID, "ltn"), (GAMING_CHANNEL_ID, "reddit")):
+                if channel_id:
+                    self.subscriptions.add(Subscription(GUILD_ID or 0, channel_id, source, DEFAULT_INTERVAL_MINUTES * 60.0))
+            await self.subscriptions.save()
+        self.sync_schedules()
+
     async def cog_load(self):
         if GUILD_ID:
             for cmd in self.get_app_commands():
                 cmd.guilds = [discord.Object(id=GUILD_ID)]  # Object 大寫
-                
-        print("cog_load() 已執行 — 啟動定時任務")
-        if not self.check_news_task.is_running():
-            self.check_news_task.start()
-            print("check_news_task started")
-        if not self.check_gaming_task.is_running():
-            self.check_gaming_task.start()
+
+        await self.load_subscriptions()  # 先載入訂閱，seen 的數量上限依訂閱數決定
+        await self.seen.load()
+        await self.stories.load()
+        print(f"cog_load() 已執行 — {len(self.subscriptions)} 個訂閱，啟動新聞排程")
+        if not self.news_scheduler.is_running():
+            self.news_scheduler.start()
+
+    async def cog_unload(self):
+        self.news_scheduler.cancel()
+        if self.election is not None:
+            self.election.release()
+        await self.seen.save()
+        await self.stories.save()
+        await close_session()
+        shutdown_parser_pool()
 
     def get_app_commands(self):
         return [c for c in self.__cog_app_commands__]
@@ -1,6 +1,13 @@
-import re, requests, feedparser
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+import os, re, time, asyncio, aiohttp, multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from fetch_cache import FetchCache
+from thumbnails import ThumbnailResolver
+from sharding import state_path
+from metrics import Counter, Gauge, NEWS_FETCH_SECONDS, NEWS_FETCH_ERRORS
+from urllib.parse import urlparse
+from extract import (extract_ltn_feed, extract_ltn_article,
+                     extract_tvbs, extract_ettoday, extract_reddit)
 
 USER_AGENT = {
     "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -10,6 +17,132 @@ USER_AGENT = {
 
 MIN_DEFAULT = 1
 MAX_DEFAULT = 5
+REQUEST_TIMEOUT = 10  # 秒
+HOST_CONCURRENCY = int(os.getenv("NEWS_HOST_CONCURRENCY", "4"))      # 同一主機同時最多幾個請求
+ARTICLE_TIMEOUT = float(os.getenv("NEWS_ARTICLE_TIMEOUT", "8"))      # 單篇文章頁的期限（秒）
+LTN_TOTAL_TIMEOUT = float(os.getenv("NEWS_LTN_TOTAL_TIMEOUT", "20")) # 整批文章頁的期限（秒）
+CACHE_DIR = state_path(os.getenv("NEWS_CACHE_DIR", os.path.join(".cache", "news")))  # 索引在記憶體，每個程序各用一份
+CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", str(7 * 24 * 3600)))       # 秒，多久沒用到就淘汰
+CACHE_MAX_BYTES = int(os.getenv("NEWS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ARTICLE_MEMO_SIZE = 2048  # 文章頁解析結果最多記住幾篇
+RESULT_TTL = float(os.getenv("NEWS_RESULT_TTL", "60"))  # 秒，同一來源的抓取結果共用多久
+PARSER_PROCESSES = int(os.getenv("NEWS_PARSER_PROCESSES", "2"))  # 0 = 改用 thread 解析
+# pool 在 bot 執行中才建立，此時已有 sqlite / log 等 thread；fork 可能複製到被鎖住的 lock 而卡死
+PARSER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+THUMBNAIL_TTL = float(os.getenv("NEWS_THUMBNAIL_TTL", str(24 * 3600)))  # 秒，圖片檢查結果保留多久
+THUMBNAIL_CACHE_SIZE = int(os.getenv("NEWS_THUMBNAIL_CACHE_SIZE", "4096"))
+THUMBNAIL_TIMEOUT = float(os.getenv("NEWS_THUMBNAIL_TIMEOUT", "5"))
+
+http_cache = FetchCache(CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES)
+Gauge("toki_http_cache_hit_ratio", "Share of conditional GETs answered with 304", lambda: http_cache.hit_rate)
+Counter("toki_http_cache_hits_total", "Conditional GETs answered with 304", func=lambda: http_cache.hits)
+Counter("toki_http_cache_misses_total", "Conditional GETs that downloaded a new body", func=lambda: http_cache.misses)
+
+# ---------- 共用 HTTP session ----------
+_session: aiohttp.ClientSession | None = None
+
+def get_session() -> aiohttp.ClientSession:
+    """所有新聞來源共用一個有連線池的 aiohttp session（需在事件迴圈中呼叫）"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            headers=USER_AGENT,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=20, limit_per_host=HOST_CONCURRENCY, ttl_dns_cache=300),
+        )
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+_host_limits: dict[str, asyncio.Semaphore] = {}
+
+def host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlparse(url).netloc
+    sem = _host_limits.get(host)
+    if sem is None:
+        sem = _host_limits[host] = asyncio.Semaphore(HOST_CONCURRENCY)
+    return sem
+
+# 縮圖檢查共用同一個連線池與主機併發上限
+thumbnails = ThumbnailResolver(get_session, host_semaphore, ttl=THUMBNAIL_TTL,
+                               max_entries=THUMBNAIL_CACHE_SIZE, timeout=THUMBNAIL_TIMEOUT)
+Counter("toki_thumbnail_cache_hits_total", "Thumbnail checks answered from cache", func=lambda: thumbnails.hits)
+Counter("toki_thumbnail_cache_misses_total", "Thumbnail checks that needed a request", func=lambda: thumbnails.misses)
+
+async def with_thumbnails(items: list[dict]) -> list[dict]:
+    """並行檢查每則新聞的圖片，無效的（佔位圖、404、不是圖片）改成 None，Discord 就不會顯示破圖"""
+    images = await asyncio.gather(*(thumbnails.resolve(item["image"]) for item in items))
+    for item, image in zip(items, images):
+        item["image"] = image
+    return items
+
+async def fetch_text(url: str, timeout: float = REQUEST_TIMEOUT, conditional: bool = True) -> tuple[str | None, tuple]:
+    """條件式 GET：內容沒變（304）時回傳 (None, 版本)，呼叫端可沿用上次的解析結果；
+    否則回傳 (內容, 版本)。conditional=False 時不帶驗證資訊"""
+    async with host_semaphore(url):
+        async with get_session().get(url, headers=http_cache.validators(url) if conditional else None,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            entry = http_cache.entry(url)
+            if r.status == 304 and not conditional:
+                # 沒帶驗證資訊卻回 304（伺服器或 proxy 有問題），不再重試
+                raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status,
+                                                  message="304 without validators", headers=r.headers)
+            if r.status != 304:
+                r.raise_for_status()
+                text = await r.text()
+                entry = await http_cache.store(url, text, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                return text, entry.version
+            if entry is not None:
+                http_cache.touch(url)
+                return None, entry.version
+    # 送出請求後快取剛好被淘汰：已沒有驗證資訊，改用一般 GET 重抓一次
+    return await fetch_text(url, timeout=timeout, conditional=False)
+
+_parser_pool: ProcessPoolExecutor | None = None
+
+def get_parser_pool() -> ProcessPoolExecutor | None:
+    global _parser_pool
+    if _parser_pool is None and PARSER_PROCESSES > 0:
+        _parser_pool = ProcessPoolExecutor(max_workers=PARSER_PROCESSES,
+                                           mp_context=multiprocessing.get_context(PARSER_START_METHOD))
+    return _parser_pool
+
+def shutdown_parser_pool():
+    global _parser_pool
+    if _parser_pool is not None:
+        _parser_pool.shutdown(wait=False, cancel_futures=True)
+    _parser_pool = None
+
+async def run_parser(func, *args):
+    """HTML/RSS 解析丟到 process pool，可用到多顆核心，也不會卡住事件迴圈（含 GIL）"""
+    return await asyncio.get_running_loop().run_in_executor(get_parser_pool(), func, *args)
+
+# (url, parser, args) -> (版本, 解析結果)；內容沒變時直接回傳，不重新解析
+_parsed: dict[tuple, tuple] = {}
+
+async def fetch_parsed(url: str, parse, *args, timeout: float = REQUEST_TIMEOUT, memo: bool = True):
+    """下載並解析；304 時優先用記憶體中的解析結果，其次讀磁碟快取重新解析
+    memo=False 時不記住解析結果（呼叫端自行快取，例如文章頁）"""
+    key = (url, parse, args)
+    text, version = await fetch_text(url, timeout=timeout)
+    if text is None:
+        cached = _parsed.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            text = await asyncio.to_thread(http_cache.read, url)
+        except FileNotFoundError:
+            # 內容被刪掉（例如寫入失敗）：當成沒有快取，重新下載
+            http_cache.drop(url)
+            text, version = await fetch_text(url, timeout=timeout, conditional=False)
+    result = await run_parser(parse, text, *args)
+    if memo:
+        _parsed[key] = (version, result)
+    return result
 
 def format(time, title, url, image):
     return {"time":time.strip() if time else None,
@@ -17,71 +150,67 @@ def format(time, title, url, image):
             "url": url.strip() if url else "",
             "image": image.strip() if image else None,}
 
-def clean_url(u: str | None, base: str) -> str | None:
-    if not u:
-        return None
-    u = u.strip()
-    if u.startswith("//"):
-        u = "https:" + u
-    if not u.startswith("http"):
-        u = urljoin(base, u)
-    parsed = urlparse(u)
-    if parsed.scheme not in ("http", "https"):
-        return None
-    return u
-
 def shorten(text: str, max_len: int = 40) -> str:
     text = re.sub(r"\s+", " ", text.strip())
     return text if len(text) <= max_len else text[:max_len - 1] + "…"
 
 # ---------- ltn ----------
-def get_ltn(limit: int = MAX_DEFAULT):
-    rss_url = "https://news.ltn.com.tw/rss/all.xml"
-    feed = feedparser.parse(rss_url)
-    results = []
+LTN_RSS = "https://news.ltn.com.tw/rss/all.xml"
 
-    for entry in feed.entries[:limit]:
-        url = entry.link
-        title = entry.title
+# 文章頁發布後 og:image / 時間不會變，以 URL 記住解析結果（LRU）
+_article_meta: OrderedDict[str, tuple] = OrderedDict()
 
-        # 進入文章頁抓 og:image + 時間
-        try:
-            r2 = requests.get(url, headers=USER_AGENT, timeout=10)
-            r2.raise_for_status()
-            soup2 = BeautifulSoup(r2.text, "lxml")
-
-            # 標題
-            h1 = soup2.select_one("h1")
-            title = h1.get_text(strip=True) if h1 else entry.title
-
-            # 時間
-            time_str = None
-            meta_time = soup2.find("meta", property="article:published_time")
-            if meta_time and meta_time.get("content"):
-                m = re.search(r"T(\d{2}:\d{2})", meta_time["content"])
-                if m:
-                    time_str = m.group(1)
-
-            # 圖片
-            og_img = soup2.find("meta", property="og:image")
-            img_url = og_img["content"].strip() if og_img and og_img.get("content") else None
-            img_url = clean_url(img_url, url)
-        except Exception as e:
-            print(f"{rss_url}抓取內頁失敗：{e}")
-            continue
-
-        if not img_url:
-            print(f"{rss_url} 無圖片，跳過：{url}")
-            continue
-
-        title_text = f"{shorten(title, 60)}"
-
-        results.append({
-            "time": time_str,
-            "title": title_text,     # 這是 embed title
-            "url": url,
-            "image": img_url,
-        })
+async def enrich_ltn_entry(url: str, feed_title: str, rss_url: str, timeout: float):
+    """RSS 沒有可用圖片時才抓單篇文章頁補上標題/時間/og:image；失敗回傳 None"""
+    # 進入文章頁抓 og:image + 時間
+    try:
+        meta = _article_meta.get(url)
+        if meta is None:
+            meta = await fetch_parsed(url, extract_ltn_article, url, feed_title, timeout=timeout, memo=False)
+            _article_meta[url] = meta
+            if len(_article_meta) > ARTICLE_MEMO_SIZE:
+                _article_meta.popitem(last=False)
+        else:
+            _article_meta.move_to_end(url)
+        title, time_str, img_url = meta
+    except Exception as e:
+        print(f"{rss_url}抓取內頁失敗：{e!r}")
+        return None
+
+    title_text = f"{shorten(title, 60)}"
+
+    return {
+        "time": time_str,
+        "title": title_text,     # 這是 embed title
+        "url": url,
+        "image": await thumbnails.resolve(img_url),
+    }
+
+async def ltn_entry(url: str, title: str, time_str: str | None, image: str | None,
+                    rss_url: str, timeout: float):
+    """RSS 的圖片有效就直接用，不抓文章頁；都沒有圖片時文章照發，只是沒有縮圖"""
+    image = await thumbnails.resolve(image)
+    if image is not None:
+        return format(time_str, shorten(title, 60), url, image)
+    return await enrich_ltn_entry(url, title, rss_url, timeout) or format(time_str, shorten(title, 60), url, None)
+
+async def get_ltn(limit: int = MAX_DEFAULT, request_timeout: float = ARTICLE_TIMEOUT,
+                  total_timeout: float = LTN_TOTAL_TIMEOUT):
+    rss_url = LTN_RSS
+    entries = await fetch_parsed(rss_url, extract_ltn_feed, limit)
+
+    # 並行處理（同主機的併發數由 host_semaphore 限制）
+    tasks = [asyncio.create_task(ltn_entry(*entry, rss_url, request_timeout)) for entry in entries]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, timeout=total_timeout)
+    for t in pending:
+        t.cancel()
+    if pending:
+        print(f"{rss_url} 超過 {total_timeout}s，放棄 {len(pending)} 篇文章頁")
+
+    # 依 RSS 順序回傳已完成的部分結果
+    results = [t.result() for t in tasks if t in done and t.result()]
 
     print(f"成功抓到 {len(results)} 則 LTN 新聞")
     return results
@@ -89,83 +218,66 @@ def get_ltn(limit: int = MAX_DEFAULT):
     
 
 # ---------- TVBS ----------
-def get_tvbs(limit: int = 3):
-    base = "https://news.tvbs.com.tw/realtime"
-    r = requests.get(base, headers=USER_AGENT, timeout=10)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
-
-    items = []
-    for li in soup.select("li.news_list")[:limit]:
-        a = li.select_one("h2 a")
-        if not a:
-            continue
-        title = a.get_text(strip=True)
-        url = urljoin(base, a.get("href", ""))
-
-        tnode = li.select_one(".time") or li.select_one("div.time")
-        time_str = None
-        if tnode:
-            m = re.search(r"\b(\d{1,2}:\d{2})\b", tnode.get_text(" ", strip=True))
-            time_str = m.group(1) if m else None
-
-        img_el = li.select_one("img")
-        image = urljoin(base, img_el.get("src", "")) if img_el and img_el.get("src") else None
-        items.append(format(time_str, title, url, image))
-    return items
+TVBS_URL = "https://news.tvbs.com.tw/realtime"
+
+async def get_tvbs(limit: int = 3):
+    rows = await fetch_parsed(TVBS_URL, extract_tvbs, limit, TVBS_URL)
+    return await with_thumbnails([format(*row) for row in rows])
 
 # ---------- ETtoday ----------
-def get_ettoday(limit: int = 3):
-    base = "https://www.ettoday.net/news/realtime-hot.htm"
-    r = requests.get(base, headers=USER_AGENT, timeout=10)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
-
-    items = []
-    for h3 in soup.select("div.part_list_2 h3")[:limit]:
-        a = h3.select_one("a")
-        if not a:
-            continue
-        title = a.get_text(strip=True)
-        url = urljoin(base, a.get("href", ""))
-
-        tnode = h3.select_one("span.date")
-        time_str = None
-        if tnode:
-            m = re.search(r"\b(\d{1,2}:\d{2})\b", tnode.get_text(" ", strip=True))
-            time_str = m.group(1) if m else None
-
-        # 圖片：版面不一定有，盡量抓
-        image = None
-        sib_a = h3.find_previous_sibling("a")
-        if sib_a:
-            img = sib_a.select_one("img")
-            if img and img.get("src"):
-                image = urljoin(base, img.get("src"))
-        items.append(format(time_str, title, url, image))
-    return items
+ETTODAY_URL = "https://www.ettoday.net/news/realtime-hot.htm"
+
+async def get_ettoday(limit: int = 3):
+    rows = await fetch_parsed(ETTODAY_URL, extract_ettoday, limit, ETTODAY_URL)
+    return await with_thumbnails([format(*row) for row in rows])
 
 # ---------- Reddit（r/Games） ----------
-def get_reddit_gaming(limit: int = 2):
-    base = "https://www.reddit.com/r/Games/"
-    r = requests.get(base, headers=USER_AGENT, timeout=10)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
-
-    posts = soup.select("shreddit-post")[:limit]
-    items = []
-    for p in posts:
-        title = p.get("post-title") or p.get("data-adclicktitle")
-        url = p.get("content-href") or p.get("permalink")
-        if not title or not url:
-            continue
-        image = p.get("thumbnail-url")
-        items.append(format(None, shorten(title, 120), url, image))
-    return items
+REDDIT_URL = "https://www.reddit.com/r/Games/"
+
+async def get_reddit_gaming(limit: int = 2):
+    rows = await fetch_parsed(REDDIT_URL, extract_reddit, limit)
+    return await with_thumbnails([format(time_str, shorten(title, 120), url, image)
+                                  for time_str, title, url, image in rows])
 
 NEWS_SOURCES = {
     "ltn": get_ltn,
     "tvbs": get_tvbs,
     "ettoday": get_ettoday,
     "reddit": get_reddit_gaming,   # 遊戲新聞
-}
\ No newline at end of file
+}
+
+# ---------- 抓取結果共用（single-flight + 短 TTL） ----------
+_results: dict[str, tuple[float, list]] = {}
+_inflight: dict[str, asyncio.Task] = {}
+
+def _finish_fetch(source: str, task: asyncio.Task):
+    _inflight.pop(source, None)
+    if not task.cancelled() and task.exception() is None:
+        _results[source] = (time.monotonic(), task.result())
+
+async def _timed_fetch(source: str) -> list[dict]:
+    started = time.perf_counter()
+    try:
+        return await NEWS_SOURCES[source]()
+    except Exception:
+        NEWS_FETCH_ERRORS.inc(source=source)
+        raise
+    finally:
+        NEWS_FETCH_SECONDS.observe(time.perf_counter() - started, source=source)
+
+async def fetch_news(source: str, ttl: float = RESULT_TTL) -> list[dict]:
+    """取得某來源的新聞
+
+    ttl 秒內的結果直接共用；同時有多個呼叫者時只會有一次實際抓取，其他人等同一個結果。
+    第一個呼叫者被取消時，抓取仍會完成並留給其他人使用。
+    """
+    cached = _results.get(source)
+    if cached is not None and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+
+    task = _inflight.get(source)
+    if task is None:
+        task = asyncio.create_task(_timed_fetch(source))
+        task.add_done_callback(lambda t: _finish_fetch(source, t))
+        _inflight[source] = task
+    return await asyncio.shield(task)
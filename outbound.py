@@ -0,0 +1,185 @@
+import asyncio, logging, time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+PRIORITY_INTERACTIVE = 0  # 關鍵字回覆等需要即時回應的訊息
+PRIORITY_BULK = 1         # 新聞等可以稍後再送的訊息
+
+
+class TokenBucket:
+    """簡單的 token bucket：capacity 個 token，每 per 秒補滿"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """取一個 token；需要等待時回傳要等幾秒（不扣 token）"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class _Job:
+    kwargs: dict
+    dedup_key: object
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class _ChannelQueue:
+    __slots__ = ("channel", "queues", "bucket", "pending_keys", "worker")
+
+    def __init__(self, channel, bucket: TokenBucket):
+        self.channel = channel
+        self.queues = (deque(), deque())  # 依優先序
+        self.bucket = bucket
+        self.pending_keys: dict[object, _Job] = {}
+        self.worker: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self.queues[0]) + len(self.queues[1])
+
+    def pop(self) -> _Job:
+        return (self.queues[0] or self.queues[1]).popleft()
+
+
+class OutboundScheduler:
+    """所有 cog 共用的發送佇列
+
+    - 每個頻道一個 token bucket（Discord 頻道發言限制約 5 則 / 5 秒）與一個全域 bucket
+    - 關鍵字回覆優先於新聞；同頻道內尚未送出的相同回覆只送一次
+    - 頻道佇列滿時丟棄即時回覆（過時的回覆沒有意義），新聞則照排
+    """
+
+    def __init__(self, channel_rate: int = 5, channel_per: float = 5.0,
+                 global_rate: int = 50, global_per: float = 1.0, max_interactive_backlog: int = 20):
+        self.channel_rate = channel_rate
+        self.channel_per = channel_per
+        self.max_interactive_backlog = max_interactive_backlog
+        self._global = TokenBucket(global_rate, global_per)
+        self._channels: dict[int, _ChannelQueue] = {}
+        # 佇列清空後 bucket 仍需保留一段時間，才不會讓下一波瞬間超量；以 LRU 限制數量
+        self._buckets: OrderedDict[int, TokenBucket] = OrderedDict()
+        self.max_buckets = 4096
+        # 背壓指標
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        """目前所有頻道排隊中的訊息數"""
+        return sum(len(q) for q in self._channels.values())
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "channels": len(self._channels),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "max_wait": self.max_wait,
+        }
+
+    def _bucket(self, channel_id: int) -> TokenBucket:
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(self.channel_rate, self.channel_per)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(channel_id)
+        return bucket
+
+    def submit(self, channel, priority: int = PRIORITY_BULK, dedup_key=None, **kwargs) -> asyncio.Future:
+        """排入佇列並立即返回 future；完成時結果為送出的 discord.Message，被丟棄時為 None
+        fire-and-forget 用：送出失敗只記錄警告"""
+        return self._enqueue(channel, priority, dedup_key, kwargs, log_errors=True)
+
+    async def send(self, channel, priority: int = PRIORITY_BULK, dedup_key=None, **kwargs):
+        """排入佇列並等到實際送出；送出失敗時拋出原本的例外（由呼叫端處理，不另外記錄）"""
+        return await self._enqueue(channel, priority, dedup_key, kwargs, log_errors=False)
+
+    def _enqueue(self, channel, priority: int, dedup_key, kwargs: dict, log_errors: bool) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        cq = self._channels.get(channel.id)
+        if cq is None:
+            cq = self._channels[channel.id] = _ChannelQueue(channel, self._bucket(channel.id))
+
+        if dedup_key is not None and dedup_key in cq.pending_keys:
+            self.coalesced += 1
+            return cq.pending_keys[dedup_key].future
+
+        future = loop.create_future()
+        if log_errors:
+            future.add_done_callback(_consume_exception)
+        if priority == PRIORITY_INTERACTIVE and len(cq.queues[PRIORITY_INTERACTIVE]) >= self.max_interactive_backlog:
+            self.dropped += 1
+            future.set_result(None)
+            return future
+
+        job = _Job(kwargs, dedup_key, future)
+        cq.queues[priority].append(job)
+        if dedup_key is not None:
+            cq.pending_keys[dedup_key] = job
+        if cq.worker is None or cq.worker.done():
+            cq.worker = loop.create_task(self._drain(cq))
+        return future
+
+    async def _drain(self, cq: _ChannelQueue):
+        while len(cq):
+            # 先等頻道與全域的 token，再取工作，等待期間插隊的即時回覆仍會先送
+            wait = cq.bucket.delay()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            wait = self._global.delay()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self._global.delay()
+
+            job = cq.pop()
+            if job.dedup_key is not None:
+                cq.pending_keys.pop(job.dedup_key, None)
+            self.max_wait = max(self.max_wait, time.monotonic() - job.queued_at)
+            try:
+                message = await cq.channel.send(**job.kwargs)
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(message)
+
+        self._channels.pop(cq.channel.id, None)  # 佇列清空就釋放，記憶體只跟活躍頻道數有關
+
+    async def close(self):
+        for cq in list(self._channels.values()):
+            if cq.worker is not None:
+                cq.worker.cancel()
+            for queue in cq.queues:
+                for job in queue:
+                    if not job.future.done():
+                        job.future.cancel()
+        self._channels.clear()
+
+
+def _consume_exception(future: asyncio.Future):
+    """fire-and-forget 的 submit() 不會有人讀例外，先記錄避免 asyncio 警告"""
+    if not future.cancelled() and future.exception() is not None:
+        logging.warning(f"發送訊息失敗：{future.exception()!r}")
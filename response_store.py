@@ -0,0 +1,411 @@
+import asyncio, json, logging, os, sqlite3
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from keyword_matcher import KeywordMatcher
+
+DM_GUILD_ID = 0  # 私訊沒有 guild，統一存在 guild_id = 0
+ALL_CHANNELS = 0  # 冷卻設定套用到伺服器內所有頻道
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    guild_id INTEGER NOT NULL,
+    keyword  TEXT    NOT NULL,
+    response TEXT    NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, keyword)
+);
+CREATE INDEX IF NOT EXISTS responses_guild_position ON responses (guild_id, position);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    guild_id   INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,  -- 0 表示伺服器內所有頻道
+    keyword    TEXT    NOT NULL,
+    seconds    REAL    NOT NULL,
+    PRIMARY KEY (guild_id, channel_id, keyword)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+-- 每次寫入記錄改了哪些 guild，共用 DB 的其他程序只需讓這些 guild 的快取失效
+CREATE TABLE IF NOT EXISTS changes (
+    seq      INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL
+);
+"""
+CHANGE_LOG_KEEP = 10_000  # changes 只保留最近這麼多筆
+
+
+class KeywordTable:
+    """單一伺服器的關鍵字表與比對索引
+
+    比對索引（Aho-Corasick）在大表上要建好幾百 ms，一律在 worker thread 建好再換上；
+    重建期間沿用舊索引，所以 matcher 可能短暫回傳已刪除的關鍵字（呼叫端以 responses.get 檢查）
+    """
+
+    __slots__ = ("responses", "matcher", "cooldowns", "_sorted", "_version")
+
+    def __init__(self, responses: dict[str, str] | None = None,
+                 cooldowns: dict[tuple[int, str], float] | None = None,
+                 matcher: KeywordMatcher | None = None):
+        self.responses = responses or {}
+        self.matcher = matcher if matcher is not None else KeywordMatcher(self.responses)
+        self.cooldowns = cooldowns or {}  # (channel_id, keyword) -> 秒
+        self._sorted: list[str] | None = None  # 排序後的關鍵字，/response show 用到時才建立
+        self._version = 0  # 每次要求重建索引就加一，只換上最新一次的結果
+
+    def set(self, keyword: str, response: str) -> bool:
+        """回傳是否為新關鍵字（需要重建索引；只改回應內容時索引不變）"""
+        is_new = keyword not in self.responses
+        self.responses[keyword] = response
+        if is_new:
+            self._sorted = None
+        return is_new
+
+    def remove(self, keyword: str) -> bool:
+        if keyword not in self.responses:
+            return False
+        del self.responses[keyword]
+        self._sorted = None
+        # 冷卻設定跟著關鍵字一起刪，重新新增時不會沿用舊設定
+        for key in [key for key in self.cooldowns if key[1] == keyword]:
+            del self.cooldowns[key]
+        return True
+
+    def page(self, prefix: str, page: int, per_page: int) -> tuple[list[tuple[str, str]], int]:
+        """以 prefix 開頭的關鍵字中第 page 頁（從 0 開始）的 (keyword, response)，以及符合的總數
+        排序索引建立後，每次只做兩次二分搜尋與一頁的切片，成本與表的大小無關"""
+        if self._sorted is None:
+            self._sorted = sorted(self.responses)
+        keys = self._sorted
+        lo = bisect_left(keys, prefix)
+        hi = bisect_left(keys, prefix + "\U0010ffff") if prefix else len(keys)
+        start = lo + page * per_page
+        return [(k, self.responses[k]) for k in keys[start:min(start + per_page, hi)]], hi - lo
+
+    async def rebuild(self):
+        """在 worker thread 重建比對索引，完成後才換上"""
+        self._version += 1
+        version = self._version
+        matcher = await asyncio.to_thread(KeywordMatcher, list(self.responses))
+        if version == self._version:  # 期間又有變更時，交給較新的那次重建
+            self.matcher = matcher
+
+    def cooldown_for(self, channel_id: int, keyword: str) -> float:
+        """頻道專屬設定優先，其次是全伺服器設定；沒有設定回傳 0"""
+        cooldowns = self.cooldowns
+        if not cooldowns:
+            return 0.0
+        seconds = cooldowns.get((channel_id, keyword))
+        if seconds is None:
+            seconds = cooldowns.get((ALL_CHANNELS, keyword), 0.0)
+        return seconds
+
+
+class GuildResponseStore:
+    """以 SQLite 儲存、依 guild 分表的關鍵字回應
+
+    - 每個 guild 的 KeywordTable 第一次用到時才從 DB 載入，閒置的 guild 以 LRU 淘汰
+    - 修改先套用到記憶體，再合併 flush_delay 秒內的變更，用一個 transaction 寫入 (write-behind)
+    - 所有 SQLite 操作都在單一 worker thread 執行，不佔用事件迴圈
+    """
+
+    def __init__(self, db_path: str, max_guilds: int = 256, flush_delay: float = 1.0):
+        self.db_path = db_path
+        self.max_guilds = max_guilds
+        self.flush_delay = flush_delay
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="responses-db")
+        self._conn: sqlite3.Connection | None = None
+        self._tables: OrderedDict[int, KeywordTable] = OrderedDict()
+        self._loading: dict[int, asyncio.Future] = {}
+        # guild_id -> [(keyword, response 或 None 表示刪除), ...]，依操作順序保存
+        self._pending: dict[int, list[tuple[str, str | None]]] = {}
+        self._writing: dict[int, list[tuple[str, str | None]]] = {}  # 已送進 worker、尚未寫完的變更
+        self._flush_task: asyncio.Task | None = None
+        self._data_version: int | None = None
+        self._change_seq = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # ---------- DB（worker thread） ----------
+    def _open_db(self) -> int:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        self._conn = conn
+        self._change_seq = self._max_change_seq()
+        return self._read_data_version()
+
+    def _load_rows(self, guild_id: int) -> dict[str, str]:
+        rows = self._conn.execute(
+            "SELECT keyword, response FROM responses WHERE guild_id = ? ORDER BY position",
+            (guild_id,),
+        )
+        return dict(rows.fetchall())
+
+    def _load_guild(self, guild_id: int) -> tuple[dict[str, str], dict[tuple[int, str], float]]:
+        """回應與冷卻設定在同一次 worker 呼叫中讀取"""
+        return self._load_rows(guild_id), self._load_cooldowns(guild_id)
+
+    def _load_cooldowns(self, guild_id: int) -> dict[tuple[int, str], float]:
+        rows = self._conn.execute(
+            "SELECT channel_id, keyword, seconds FROM cooldowns WHERE guild_id = ?", (guild_id,)
+        )
+        return {(channel_id, keyword): seconds for channel_id, keyword, seconds in rows.fetchall()}
+
+    def _max_change_seq(self) -> int:
+        return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def _log_changes(self, guild_ids):
+        """在呼叫端的 transaction 內執行"""
+        self._conn.executemany("INSERT INTO changes (guild_id) VALUES (?)", [(g,) for g in guild_ids])
+        self._conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_KEEP,))
+
+    def _changed_guilds(self) -> set[int] | None:
+        """上次檢查後被改過的 guild；沒有紀錄（例如直接用 sqlite 工具修改）時回傳 None"""
+        rows = self._conn.execute(
+            "SELECT seq, guild_id FROM changes WHERE seq > ? ORDER BY seq", (self._change_seq,)
+        ).fetchall()
+        if not rows:
+            return None
+        self._change_seq = rows[-1][0]
+        return {guild_id for _, guild_id in rows}
+
+    def _write_cooldown(self, guild_id: int, channel_id: int, keyword: str, seconds: float):
+        with self._conn:
+            self._log_changes((guild_id,))
+            if seconds > 0:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cooldowns (guild_id, channel_id, keyword, seconds) VALUES (?, ?, ?, ?)",
+                    (guild_id, channel_id, keyword, seconds),
+                )
+            else:
+                self._conn.execute(
+                    "DELETE FROM cooldowns WHERE guild_id = ? AND channel_id = ? AND keyword = ?",
+                    (guild_id, channel_id, keyword),
+                )
+
+    def _write_ops(self, ops: dict[int, list[tuple[str, str | None]]]):
+        with self._conn:
+            self._log_changes(ops)
+            for guild_id, changes in ops.items():
+                for keyword, response in changes:
+                    if response is None:
+                        self._conn.execute(
+                            "DELETE FROM responses WHERE guild_id = ? AND keyword = ?",
+                            (guild_id, keyword),
+                        )
+                        self._conn.execute(
+                            "DELETE FROM cooldowns WHERE guild_id = ? AND keyword = ?",
+                            (guild_id, keyword),
+                        )
+                    else:
+                        self._conn.execute(
+                            "INSERT INTO responses (guild_id, keyword, response, position) "
+                            "VALUES (?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM responses WHERE guild_id = ?)) "
+                            "ON CONFLICT (guild_id, keyword) DO UPDATE SET response = excluded.response",
+                            (guild_id, keyword, response, guild_id),
+                        )
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _close_db(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # ---------- 生命週期 ----------
+    async def open(self):
+        self._data_version = await self._run(self._open_db)
+
+    async def close(self):
+        await self.flush()
+        await self._run(self._close_db)
+        self._executor.shutdown(wait=False)
+
+    # ---------- 讀取 ----------
+    def cached(self, guild_id: int) -> KeywordTable | None:
+        """熱路徑用：已在記憶體就直接回傳，不做任何 I/O"""
+        table = self._tables.get(guild_id)
+        if table is not None:
+            self._tables.move_to_end(guild_id)
+        return table
+
+    async def get(self, guild_id: int) -> KeywordTable:
+        table = self.cached(guild_id)
+        if table is not None:
+            return table
+
+        # 同一 guild 同時有多則訊息 miss 時只查一次 DB
+        loading = self._loading.get(guild_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[guild_id] = future
+        try:
+            responses, cooldowns = await self._run(self._load_guild, guild_id)
+            # 疊上尚未寫入的變更：正在寫入的（讀取時可能還沒落地）與還在排隊的
+            unwritten = self._writing.get(guild_id, []) + self._pending.get(guild_id, [])
+            for keyword, response in unwritten:
+                if response is None:
+                    responses.pop(keyword, None)
+                else:
+                    responses[keyword] = response
+            matcher = await asyncio.to_thread(KeywordMatcher, list(responses))  # 不在事件迴圈上建索引
+            table = KeywordTable(responses, cooldowns, matcher)
+            self._tables[guild_id] = table
+            while len(self._tables) > self.max_guilds:
+                self._tables.popitem(last=False)  # 淘汰最久沒用到的 guild
+            future.set_result(table)
+            return table
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # 例外由本次呼叫者往上拋，避免 "never retrieved" 警告
+            raise
+        finally:
+            del self._loading[guild_id]
+
+    # ---------- 寫入 ----------
+    async def set(self, guild_id: int, keyword: str, response: str):
+        table = await self.get(guild_id)
+        is_new = table.set(keyword, response)
+        self._enqueue(guild_id, keyword, response)
+        if is_new:
+            await table.rebuild()
+
+    async def remove(self, guild_id: int, keyword: str) -> bool:
+        table = await self.get(guild_id)
+        if not table.remove(keyword):
+            return False
+        self._enqueue(guild_id, keyword, None)
+        await table.rebuild()
+        return True
+
+    async def set_cooldown(self, guild_id: int, channel_id: int, keyword: str, seconds: float):
+        """設定冷卻秒數；seconds <= 0 表示取消。設定很少變動，直接寫入不走合併佇列"""
+        table = await self.get(guild_id)
+        await self.flush()  # 先寫入排隊中的刪除，否則刪除時會一併清掉這次的設定
+        await self._run(self._write_cooldown, guild_id, channel_id, keyword, seconds)
+        if seconds > 0:
+            table.cooldowns[(channel_id, keyword)] = seconds
+        else:
+            table.cooldowns.pop((channel_id, keyword), None)
+
+    def _enqueue(self, guild_id: int, keyword: str, response: str | None):
+        self._pending.setdefault(guild_id, []).append((keyword, response))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_delay)
+            await self._write_pending()
+
+    async def _write_pending(self):
+        ops, self._pending = self._pending, {}
+        if not ops:
+            return
+        for guild_id, changes in ops.items():
+            self._writing.setdefault(guild_id, []).extend(changes)
+        # transaction 真正結束（成功或失敗）時才從 _writing 移除，這段期間載入的表仍會疊上這些變更
+        write = asyncio.ensure_future(self._run(self._write_ops, ops))
+        write.add_done_callback(lambda _: self._written(ops))
+        try:
+            # shield：flush() 取消排程時，已送進 worker 的 transaction 仍會完成
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"寫入 {self.db_path} 時發生錯誤: {e}")
+            for guild_id, changes in ops.items():  # 放回佇列前端，下一輪重試
+                self._pending[guild_id] = changes + self._pending.get(guild_id, [])
+
+    def _written(self, ops: dict[int, list[tuple[str, str | None]]]):
+        for guild_id, changes in ops.items():
+            writing = self._writing.get(guild_id)
+            if writing is not None:
+                del writing[:len(changes)]
+                if not writing:
+                    del self._writing[guild_id]
+
+    async def flush(self):
+        """立即寫出尚未落地的變更（關閉前呼叫）"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._write_pending()
+
+    # ---------- 外部改動 ----------
+    async def reload_if_changed(self) -> bool:
+        """PRAGMA data_version 只會因「其他連線」的寫入而改變，成本是一次極小的查詢"""
+        if self._conn is None or self._pending:
+            return False
+        version = await self._run(self._read_data_version)
+        if version == self._data_version:
+            return False
+        self._data_version = version
+        changed = await self._run(self._changed_guilds)
+        if changed is None:
+            self._tables.clear()  # 不知道改了哪些 guild，全部在下次用到時重新載入
+            logging.info(f"{self.db_path} changed externally, cleared cached keyword tables")
+        else:
+            for guild_id in changed:
+                self._tables.pop(guild_id, None)
+        return True
+
+    # ---------- 遷移 ----------
+    def _unmigrated(self, json_path: str, guild_ids: list[int]) -> list[int]:
+        """還沒匯入過的 guild；整份檔案已遷移過（單一程序模式）時回傳空串列"""
+        if self._conn.execute("SELECT 1 FROM meta WHERE key = ?", (f"migrated:{json_path}",)).fetchone():
+            return []
+        return [g for g in guild_ids if not self._conn.execute(
+            "SELECT 1 FROM meta WHERE key = ?", (f"migrated:{json_path}:{g}",)).fetchone()]
+
+    def _import(self, json_path: str, guild_ids: list[int], responses: dict[str, str], per_guild: bool):
+        with self._conn:
+            if per_guild:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, '1')",
+                    [(f"migrated:{json_path}:{g}",) for g in guild_ids],
+                )
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    (f"migrated:{json_path}", ",".join(map(str, guild_ids))),
+                )
+            self._log_changes(guild_ids)
+            for guild_id in guild_ids:
+                start = self._conn.execute(
+                    "SELECT COALESCE(MAX(position), 0) FROM responses WHERE guild_id = ?", (guild_id,)
+                ).fetchone()[0]
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO responses (guild_id, keyword, response, position) VALUES (?, ?, ?, ?)",
+                    [(guild_id, k, str(v), start + i) for i, (k, v) in enumerate(responses.items(), 1)],
+                )
+
+    async def migrate_json(self, json_path: str, guild_ids: list[int], per_guild: bool = False) -> int:
+        """一次性把舊的全域 responses.json 匯入指定的 guild；DB 會記錄已遷移，重新部署也不會重複匯入
+
+        per_guild=True 時逐個 guild 記錄（多個程序各自遷移自己負責的 guild）"""
+        if not os.path.exists(json_path):
+            return 0
+        guild_ids = await self._run(self._unmigrated, json_path, guild_ids)
+        if not guild_ids:
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                responses = json.load(f)
+        except json.JSONDecodeError:
+            logging.warning(f"{json_path} format error，skip migration")
+            return 0
+        if not isinstance(responses, dict):
+            return 0
+
+        await self._run(self._import, json_path, guild_ids, responses, per_guild)
+        for guild_id in guild_ids:
+            self._tables.pop(guild_id, None)
+        logging.info(f"migrated {len(responses)} keywords from {json_path} into {len(guild_ids)} guild(s)")
+        return len(responses)
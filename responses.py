@@ -1,61 +1,138 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
-import logging, json, os
-
-# check JSON file existed
-RESPONSES_FILE = "responses.json"
+import logging, os, time
+from response_store import GuildResponseStore, DM_GUILD_ID, ALL_CHANNELS
+from cooldown import CooldownTracker
+from chat_log import (ChatLogSampler, chat_logger, start_chat_logging, stop_chat_logging,
+                      parse_guild_rates, CHAT_LOG_SAMPLE_RATE, CHAT_LOG_GUILD_RATES)
+from outbound import PRIORITY_INTERACTIVE
+from metrics import ON_MESSAGE_SECONDS, KEYWORD_HITS
+from sharding import MULTI_PROCESS, owns_guild
+
+RESPONSES_FILE = "responses.json"  # 舊版全域 JSON，只用於一次性遷移
+RESPONSES_DB = os.getenv("RESPONSES_DB", "responses.db")
+WATCH_INTERVAL = float(os.getenv("RESPONSES_WATCH_INTERVAL", "5"))  # 秒
+SAVE_DELAY = float(os.getenv("RESPONSES_SAVE_DELAY", "1"))  # 秒，合併這段時間內的修改
+MAX_CACHED_GUILDS = int(os.getenv("RESPONSES_MAX_CACHED_GUILDS", "256"))
+MAX_COOLDOWN_ENTRIES = int(os.getenv("RESPONSES_MAX_COOLDOWN_ENTRIES", "100000"))
+GUILD_ID = os.getenv("GUILD_ID")
+SHOW_PAGE_SIZE = 20   # /response show 每頁幾筆
+SHOW_MAX_FIELD = 80   # 每個關鍵字/回應最多顯示幾個字（20 筆 × 2 × 80 遠小於 embed 的 4096 字上限）
+SHOW_TIMEOUT = 300    # 秒，之後按鈕失效
 
 #setting logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
-if not os.path.exists(RESPONSES_FILE):
-    with open(RESPONSES_FILE, "w", encoding="UTF-8") as file:
-        json.dump({}, file)
+def guild_key(guild: discord.Guild | None) -> int:
+    return guild.id if guild else DM_GUILD_ID
+
+def shorten(text: str, max_len: int = SHOW_MAX_FIELD) -> str:
+    text = " ".join(text.split()).replace("`", "ˋ")  # 避免破壞 inline code
+    return text if len(text) <= max_len else text[:max_len - 1] + "…"
+
+class ResponsePager(discord.ui.View):
+    """/response show 的上一頁/下一頁按鈕；每次翻頁都從目前的關鍵字表重新取該頁，修改後立刻反映"""
+
+    def __init__(self, store: GuildResponseStore, guild_id: int, prefix: str, owner_id: int):
+        super().__init__(timeout=SHOW_TIMEOUT)
+        self.store = store
+        self.guild_id = guild_id
+        self.prefix = prefix
+        self.owner_id = owner_id
+        self.page = 0
+        self.pages = 1
+
+    async def render(self) -> discord.Embed | None:
+        table = self.store.cached(self.guild_id) or await self.store.get(self.guild_id)
+        rows, total = table.page(self.prefix, self.page, SHOW_PAGE_SIZE)
+        if total == 0:
+            return None
+        self.pages = (total + SHOW_PAGE_SIZE - 1) // SHOW_PAGE_SIZE
+        if self.page >= self.pages:  # 翻頁期間有關鍵字被刪除
+            self.page = self.pages - 1
+            rows, total = table.page(self.prefix, self.page, SHOW_PAGE_SIZE)
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.pages - 1
+
+        lines = [f"🔹 `{shorten(key)}` ➝ `{shorten(value)}`" for key, value in rows]
+        title = f"keyword response list: `{self.prefix}`*" if self.prefix else "keyword response list: "
+        embed = discord.Embed(title=title, description="\n".join(lines), color=0x00ff00)
+        embed.set_footer(text=f"page {self.page + 1}/{self.pages} · {total} keywords")
+        return embed
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("run /response show yourself to browse", ephemeral=True)
+            return False
+        return True
+
+    async def _turn(self, interaction: discord.Interaction, step: int):
+        self.page = max(0, self.page + step)
+        embed = await self.render()
+        if embed is None:
+            self.stop()
+            await interaction.response.edit_message(content="these no saves keyword response", embed=None, view=None)
+            return
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._turn(interaction, -1)
+
+    @discord.ui.button(label="next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._turn(interaction, 1)
 
 class Response(commands.GroupCog, name = "response"):
     """管理關鍵字回應的 Slash Commands"""
 
     def __init__(self, bot):
         self.bot = bot
-        self.responses = self.load_responses()  # 正確初始化 responses
-
-    def load_responses(self):
-        """載入 JSON 檔案中的回應資料"""
+        # SQLite 為主資料，每個 guild 的關鍵字表用到時才載入；on_message 命中快取時不做任何 I/O
+        self.store = GuildResponseStore(RESPONSES_DB, max_guilds=MAX_CACHED_GUILDS, flush_delay=SAVE_DELAY)
+        self.cooldowns = CooldownTracker(max_entries=MAX_COOLDOWN_ENTRIES)  # (guild, channel, keyword) -> 冷卻結束時間
+        self.chat_sampler = ChatLogSampler(CHAT_LOG_SAMPLE_RATE, parse_guild_rates(CHAT_LOG_GUILD_RATES))
+        self.chat_log_listener = None
+
+    async def cog_load(self):
+        self.chat_log_listener = start_chat_logging()
+        await self.store.open()
         if os.path.exists(RESPONSES_FILE):
-            try:
-                with open(RESPONSES_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)  # 確保 responses 正確載入
-            except json.JSONDecodeError:
-                logging.warning("responses.json format error，reset to empty")
-                return {}  # 防止 JSON 檔案損壞時發生錯誤
-
-        return {}  # 如果檔案不存在，回傳空字典
-
-    def save_responses(self):
-        """儲存回應資料到 JSON 檔案"""
+            if GUILD_ID and GUILD_ID.isdigit():
+                if owns_guild(int(GUILD_ID)):
+                    await self.store.migrate_json(RESPONSES_FILE, [int(GUILD_ID)], per_guild=MULTI_PROCESS)
+            else:
+                # 沒有指定伺服器時，等連上 gateway 後匯入到所有已加入的伺服器
+                self.bot.loop.create_task(self.migrate_to_joined_guilds())
+        if not self.watch_responses_db.is_running():
+            self.watch_responses_db.start()
+
+    async def cog_unload(self):
+        self.watch_responses_db.cancel()
+        await self.store.close()
+        stop_chat_logging(self.chat_log_listener)
+        self.chat_log_listener = None
+
+    async def migrate_to_joined_guilds(self):
+        await self.bot.wait_until_ready()
+        # 分片到多個程序時，bot.guilds 只有自己負責的伺服器；各程序各自匯入
+        guild_ids = [g.id for g in self.bot.guilds] + ([DM_GUILD_ID] if owns_guild(DM_GUILD_ID) else [])
+        await self.store.migrate_json(RESPONSES_FILE, guild_ids, per_guild=MULTI_PROCESS)
+
+    @tasks.loop(seconds=WATCH_INTERVAL)
+    async def watch_responses_db(self):
+        """偵測其他程式對資料庫的修改，有變動才讓快取的關鍵字表失效"""
         try:
-            #backup old responses.json
-            if os.path.exists(RESPONSES_FILE):
-                os.rename(RESPONSES_FILE, f"{RESPONSES_FILE}.backup")
-
-            #save newwest responses.json
-            with open(RESPONSES_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.responses, f, indent=4, ensure_ascii=False)
-
+            await self.store.reload_if_changed()
         except Exception as e:
-            logging.error(f"儲存 responses.json 時發生錯誤: {e}")
-            
-            # 如果寫入失敗，恢復備份
-            if os.path.exists(f"{RESPONSES_FILE}.backup"):
-                os.rename(f"{RESPONSES_FILE}.backup", RESPONSES_FILE)
-    
+            logging.error(f"檢查 {RESPONSES_DB} 變動時發生錯誤: {e}")
+
     @app_commands.command(name="add", description="add keyword's response")
     @app_commands.describe(keyword="type any keyword", response="response content")
     async def add_response(self, interaction: discord.Interaction, keyword: str, response: str):
         """新增關鍵字回應"""
-        self.responses[keyword] = response
-        self.save_responses()  # 正確存檔
+        await self.store.set(guild_key(interaction.guild), keyword, response)  # 背景合併寫入
         await interaction.response.send_message(f"add keyword: `{keyword}`，response：`{response}`")
 
 
@@ -63,33 +140,65 @@ class Response(commands.GroupCog, name = "response"):
     @app_commands.describe(keyword="type any keyword existed")
     async def remove_response(self, interaction: discord.Interaction, keyword: str):
         """刪除關鍵字回應"""
-        if keyword in self.responses:
-            del self.responses[keyword]
-            self.save_responses()
+        guild_id = guild_key(interaction.guild)
+        if await self.store.remove(guild_id, keyword):
+            self.cooldowns.clear((guild_id,), last=keyword)  # 重新新增時不沿用舊的冷卻狀態
             await interaction.response.send_message(f"removed `{keyword}`")
         else:
             await interaction.response.send_message(f"`{keyword}` does NOT existed", ephemeral=True)
 
 
-    @app_commands.command(name="show", description="show all keyword responses")
-    async def show_responses(self, interaction: discord.Interaction):
-        """顯示所有關鍵字回應"""
-        if not self.responses:
-            await interaction.response.send_message("these no saves keyword response", ephemeral=True)
+    @app_commands.command(name="cooldown", description="set keyword's reply cooldown (0 = off)")
+    @app_commands.describe(
+        keyword="type any keyword existed",
+        seconds="cooldown in seconds, 0 to turn off",
+        channel="only apply to this channel (default: whole server)",
+    )
+    async def set_cooldown(self, interaction: discord.Interaction, keyword: str,
+                           seconds: app_commands.Range[float, 0, 86400], channel: discord.TextChannel | None = None):
+        """設定關鍵字回應的冷卻時間"""
+        guild_id = guild_key(interaction.guild)
+        table = await self.store.get(guild_id)
+        if keyword not in table.responses:
+            await interaction.response.send_message(f"`{keyword}` does NOT existed", ephemeral=True)
             return
 
-        response_list = "\n".join([f"🔹 `{key}` ➝ `{value}`" for key, value in self.responses.items()])
-        response_str = "\n".join(response_list)
-
-        # Discord 限制單次訊息最大 4096 字元，超過則拆分
-        if len(response_str) > 4000:
-            chunks = [response_str[i : i + 4000] for i in range(0, len(response_str), 4000)]
-            await interaction.response.send_message("Keyword responses are too long, sending in multiple messages...")
-            for chunk in chunks:
-                await interaction.followup.send(chunk)
+        channel_id = channel.id if channel else ALL_CHANNELS
+        await self.store.set_cooldown(guild_id, channel_id, keyword, seconds)
+        where = channel.mention if channel else "all channels"
+        if seconds > 0:
+            await interaction.response.send_message(f"`{keyword}` cooldown：{seconds:g}s in {where}")
         else:
-            embed = discord.Embed(title="keyword response list: ", description=response_list, color=0x00ff00)
-            await interaction.response.send_message(embed=embed)
+            await interaction.response.send_message(f"`{keyword}` cooldown removed in {where}")
+
+
+    @app_commands.command(name="cooldowns", description="show keyword reply cooldowns")
+    async def show_cooldowns(self, interaction: discord.Interaction):
+        """顯示所有冷卻設定"""
+        table = await self.store.get(guild_key(interaction.guild))
+        if not table.cooldowns:
+            await interaction.response.send_message("there are no cooldowns", ephemeral=True)
+            return
+
+        lines = [
+            f"🔹 `{keyword}` ➝ {seconds:g}s ({f'<#{channel_id}>' if channel_id != ALL_CHANNELS else 'all channels'})"
+            for (channel_id, keyword), seconds in sorted(table.cooldowns.items(), key=lambda kv: kv[0][1])
+        ]
+        embed = discord.Embed(title="keyword cooldowns: ", description="\n".join(lines)[:4000], color=0x00ff00)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+    @app_commands.command(name="show", description="show keyword responses (paged)")
+    @app_commands.describe(prefix="only show keywords starting with this text")
+    async def show_responses(self, interaction: discord.Interaction, prefix: str | None = None):
+        """分頁顯示關鍵字回應，每次只產生一頁"""
+        view = ResponsePager(self.store, guild_key(interaction.guild), prefix or "", interaction.user.id)
+        embed = await view.render()
+        if embed is None:
+            message = f"no keyword starts with `{prefix}`" if prefix else "these no saves keyword response"
+            await interaction.response.send_message(message, ephemeral=True)
+            return
+        await interaction.response.send_message(embed=embed, view=view if view.pages > 1 else discord.utils.MISSING)
 
 
     @commands.Cog.listener()
@@ -98,25 +207,34 @@ class Response(commands.GroupCog, name = "response"):
         if message.author.bot:
             return  # 忽略機器人訊息
 
-        user_message = message.content
-
-
-        self.responses = self.load_responses()
-
-        guild_name = message.guild.name if message.guild else "私訊 (DM)"
-        channel_name = message.channel.name if message.guild else "私訊"
-        username = str(message.author)
-        user_message = str(message.content)
-        has_attachment = len(message.attachments) > 0
-
-        # 在終端機輸出聊天紀錄
-        logging.info(f'[{guild_name} - {channel_name}] {username}: "{user_message}" {"📎(附加檔案)" if has_attachment else ""}')
+        started = time.perf_counter()
+        guild_id = guild_key(message.guild)
+
+        # 聊天紀錄：依伺服器取樣，只把原始欄位放進佇列，格式化與寫檔在背景 thread
+        if self.chat_sampler.should_log(guild_id):
+            chat_logger.info("chat", extra={"chat": {
+                "guild": message.guild.name if message.guild else "私訊 (DM)",
+                "guild_id": guild_id,
+                "channel": getattr(message.channel, "name", "私訊"),
+                "channel_id": message.channel.id,
+                "user": str(message.author),
+                "content": message.content,
+                "attachments": len(message.attachments),
+            }})
+
+        table = self.store.cached(guild_id) or await self.store.get(guild_id)
+        keyword = table.matcher.match(message.content)  # 只觸發第一個符合的關鍵字回應
+        response = table.responses.get(keyword) if keyword is not None else None  # 索引重建中可能剛被刪除
+        if response is not None:
+            seconds = table.cooldown_for(message.channel.id, keyword)
+            if not seconds or self.cooldowns.allow((guild_id, message.channel.id, keyword), seconds):
+                # 交給共用佇列：優先於新聞，同頻道尚未送出的相同回覆只送一次
+                self.bot.outbound.submit(message.channel, PRIORITY_INTERACTIVE, dedup_key=response, content=response)
+                KEYWORD_HITS.inc(result="replied")
+            else:
+                KEYWORD_HITS.inc(result="cooldown")
+        ON_MESSAGE_SECONDS.observe(time.perf_counter() - started)
 
-        for keyword, response in self.responses.items():
-            if keyword in message.content:
-                await message.channel.send(response)
-                break  # 只觸發第一個符合的關鍵字回應
-        
         await self.bot.process_commands(message)  # 確保其他指令仍可運行
 
 async def setup(bot):
@@ -0,0 +1,85 @@
+import asyncio, hashlib, logging, os, struct, time
+from collections import OrderedDict
+
+RECORD = struct.Struct("<Qd")  # 8 bytes 雜湊 + 8 bytes 時間戳
+
+
+def hash_key(key: str) -> int:
+    """把任意長度的字串壓成固定 64-bit 整數"""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class SeenStore:
+    """已發送新聞的去重紀錄
+
+    - 只存 64-bit 雜湊與加入時間，不存原始字串
+    - 同時以數量 (max_items) 與時間 (max_age 秒) 設上限，舊的先淘汰
+    - 以二進位快照存到磁碟，重啟後載入，不會重發同一批新聞
+    """
+
+    def __init__(self, path: str, max_items: int = 10_000, max_age: float = 30 * 24 * 3600):
+        self.path = path
+        self.max_items = max_items
+        self.max_age = max_age
+        self._items: OrderedDict[int, float] = OrderedDict()  # 依加入時間排序
+        self._dirty = False
+        self._save_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: str) -> bool:
+        return hash_key(key) in self._items
+
+    def add(self, key: str):
+        h = hash_key(key)
+        self._items.pop(h, None)
+        self._items[h] = time.time()
+        self._dirty = True
+        self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - self.max_age
+        items = self._items
+        while items and (len(items) > self.max_items or next(iter(items.values())) < cutoff):
+            items.popitem(last=False)
+
+    # ---------- 快照 ----------
+    def _read(self) -> OrderedDict:
+        items = OrderedDict()
+        with open(self.path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % RECORD.size  # 忽略寫到一半的尾巴
+        for h, ts in RECORD.iter_unpack(data[:usable]):
+            items[h] = ts
+        return items
+
+    def _write(self, records: list[tuple[int, float]]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(RECORD.pack(h, ts) for h, ts in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    async def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            self._items = await asyncio.to_thread(self._read)
+        except OSError as e:
+            logging.warning(f"讀取 {self.path} 失敗：{e}")
+            return
+        self._prune()
+
+    async def save(self):
+        """有變更才寫快照"""
+        async with self._save_lock:  # 避免兩個任務同時寫同一個暫存檔
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, list(self._items.items()))
+            except OSError as e:
+                self._dirty = True
+                logging.warning(f"寫入 {self.path} 失敗：{e}")
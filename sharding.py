@@ -0,0 +1,57 @@
+"""分片設定
+
+SHARD_COUNT 未設定：單一連線（commands.Bot），一個程序負責全部。
+SHARD_COUNT=auto 或數字：AutoShardedBot；再設定 SHARD_IDS（例："0-3" 或 "0,2,4"）
+就只連這些 shard，其餘 shard 交給其他程序，伺服器資料與新聞訂閱也依 shard 分工。
+多程序時 metrics 的 port 是 METRICS_PORT + 第一個 shard 編號，各程序不會搶同一個 port。
+"""
+import os
+
+
+def parse_shard_ids(raw: str) -> list[int]:
+    ids = set()
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition("-")
+        ids.update(range(int(start), int(end) + 1) if sep else (int(start),))
+    return sorted(ids)
+
+
+_count = os.getenv("SHARD_COUNT", "").strip().lower()
+SHARDED = bool(_count)
+SHARD_COUNT = int(_count) if _count.isdigit() else None  # None = 由 Discord 建議數量
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", "")) or None  # None = 全部
+
+if SHARD_IDS is not None and SHARD_COUNT is None:
+    raise ValueError("設定 SHARD_IDS 時必須同時指定 SHARD_COUNT")
+if SHARD_IDS is not None and SHARD_IDS[-1] >= SHARD_COUNT:
+    raise ValueError(f"SHARD_IDS 超出範圍（SHARD_COUNT={SHARD_COUNT}）")
+
+# 只負責部分 shard 時，其他程序共用同一份資料，需要分工
+MULTI_PROCESS = SHARD_IDS is not None and len(SHARD_IDS) < SHARD_COUNT
+SHARD_LABEL = f"shard{SHARD_IDS[0]}-{SHARD_IDS[-1]}" if MULTI_PROCESS else ""
+
+
+def shard_for(guild_id: int, shard_count: int) -> int:
+    """Discord 的分片規則：(guild_id >> 22) % shard_count"""
+    return (guild_id >> 22) % shard_count
+
+
+def owns_guild(guild_id: int) -> bool:
+    """這個程序是否負責此伺服器；私訊與尚未知道伺服器的資料（guild_id = 0）歸 shard 0"""
+    if not MULTI_PROCESS:
+        return True
+    return shard_for(guild_id, SHARD_COUNT) in SHARD_IDS
+
+
+IS_PRIMARY = owns_guild(0)  # 負責 shard 0 的程序處理全域工作（例如同步 Slash 指令）
+
+
+def state_path(path: str) -> str:
+    """每個程序各自的狀態檔（例：news_seen.bin → news_seen.shard0-3.bin），避免多個程序互寫"""
+    if not MULTI_PROCESS:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{SHARD_LABEL}{ext}"
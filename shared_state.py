@@ -0,0 +1,105 @@
+"""同一台機器上多個 bot 程序（分片）之間共用的狀態
+
+- file_lock：跨程序的讀-改-寫互斥
+- FetcherElection：以檔案鎖選出唯一負責抓新聞的程序
+- SharedResults：抓取結果寫到共用目錄，其他程序直接讀取，不重複抓
+"""
+import asyncio, contextlib, json, logging, os
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 flock：只支援單一程序
+    fcntl = None
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """阻塞式的排他鎖（會卡住呼叫的 thread，請在 worker thread 使用）"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # 關閉 fd 同時釋放鎖
+
+
+class FetcherElection:
+    """持有鎖的程序負責抓取；它結束（包含當掉）時作業系統會釋放鎖，其他程序下次嘗試就會接手"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        logging.info(f"pid {os.getpid()} 成為新聞抓取程序")
+        return True
+
+    def release(self):
+        if self._fd is not None and self._fd >= 0:
+            os.close(self._fd)
+        self._fd = None
+
+
+class SharedResults:
+    """每個來源最新一次的抓取結果（JSON），以檔案的 mtime 當版本號"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, source: str) -> str:
+        return os.path.join(self.directory, f"{source}.json")
+
+    def _write(self, source: str, items: list[dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(source)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read(self, source: str, since: int) -> tuple[int, list[dict]] | None:
+        path = self._path(source)
+        try:
+            version = os.stat(path).st_mtime_ns
+            if version <= since:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return version, json.load(f)
+        except FileNotFoundError:
+            return None
+
+    async def publish(self, source: str, items: list[dict]):
+        try:
+            await asyncio.to_thread(self._write, source, items)
+        except OSError as e:
+            logging.warning(f"寫入共用新聞結果 {source} 失敗：{e}")
+
+    async def read_new(self, source: str, since: int = 0) -> tuple[int, list[dict]] | None:
+        """版本比 since 新時回傳 (版本, items)，否則 None"""
+        try:
+            return await asyncio.to_thread(self._read, source, since)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"讀取共用新聞結果 {source} 失敗：{e}")
+            return None
@@ -0,0 +1,179 @@
+import asyncio, json, logging, os, random, time, unicodedata
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from extract import clean_url
+from seen_store import hash_key
+
+# 追蹤用的 query 參數，不影響文章內容
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "from", "_ga", "spm"}
+TRACKING_PREFIXES = ("utm_",)
+
+SHINGLE = 2          # 中文標題用 2 字元 shingle
+MIN_SHINGLES = 4     # 太短的標題只比對網址，不比對標題
+NUM_PERM = 32        # MinHash 簽章長度
+BAND_ROWS = 2        # LSH：每 2 個值一個 band，共 16 個 band
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240117)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def canonical_url(url: str) -> str:
+    """同一篇文章的不同網址寫法收斂成同一個字串：
+    統一 https、小寫主機、去掉 www. 與預設 port、移除追蹤參數與 fragment、query 排序"""
+    u = clean_url(url, url) or url.strip()
+    parts = urlsplit(u)
+    host = (parts.hostname or "").lower().removeprefix("www.")
+    try:
+        port = f":{parts.port}" if parts.port and parts.port not in (80, 443) else ""
+    except ValueError:
+        port = ""
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return f"https://{host}{port}{path}" + (f"?{urlencode(query)}" if query else "")
+
+
+def normalize_title(title: str) -> str:
+    """全形轉半形、轉小寫，只留文字與數字（中日韓文字也算）"""
+    return "".join(ch for ch in unicodedata.normalize("NFKC", title).lower() if ch.isalnum())
+
+
+def shingles(text: str) -> frozenset[int]:
+    return frozenset(hash_key(text[i:i + SHINGLE]) for i in range(len(text) - SHINGLE + 1))
+
+
+def minhash(features: frozenset[int]) -> tuple[int, ...]:
+    return tuple(min((a * h + b) % _PRIME for h in features) for a, b in _PERMS)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class _Story:
+    __slots__ = ("story_id", "url", "text", "features", "bands", "seen_at")
+
+    def __init__(self, story_id: str, url: str, text: str, seen_at: float):
+        self.story_id = story_id
+        self.url = url
+        self.text = text
+        self.features = shingles(text) if len(text) >= MIN_SHINGLES + SHINGLE - 1 else frozenset()
+        self.bands = _bands(minhash(self.features)) if self.features else ()
+        self.seen_at = seen_at
+
+
+def _bands(signature: tuple[int, ...]) -> tuple:
+    return tuple(hash(signature[i:i + BAND_ROWS]) for i in range(0, NUM_PERM, BAND_ROWS))
+
+
+class StoryIndex:
+    """跨來源的同一則新聞判定
+
+    - 網址先正規化（canonical_url），相同就是同一則
+    - 否則以標題的 2 字元 shingle 算 MinHash，LSH 分 band 建索引找候選，
+      再以實際 Jaccard 相似度 >= similarity 確認
+    - 只保留最近 window 秒、最多 max_items 則（滾動視窗），快照存到磁碟
+
+    resolve() 回傳故事 ID（第一次看到時的正規化網址），
+    不同來源或改過標題的同一則新聞會得到相同的 ID。
+    """
+
+    def __init__(self, path: str, window: float = 48 * 3600, max_items: int = 5000, similarity: float = 0.5):
+        self.path = path
+        self.window = window
+        self.max_items = max_items
+        self.similarity = similarity
+        self._stories: OrderedDict[str, _Story] = OrderedDict()  # 正規化網址 -> 故事，依最後出現時間排序
+        self._bands: list[dict[int, set[str]]] = [{} for _ in range(NUM_PERM // BAND_ROWS)]
+        self._dirty = False
+        self._save_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._stories)
+
+    def resolve(self, url: str, title: str) -> str:
+        canon = canonical_url(url)
+        story = self._stories.get(canon)
+        if story is None:
+            story = _Story(canon, canon, normalize_title(title), time.time())
+            match = self._similar(story)
+            if match is not None:
+                story.story_id = match.story_id
+            self._insert(story)
+        else:
+            story.seen_at = time.time()
+            self._stories.move_to_end(canon)
+        self._dirty = True
+        self._prune()
+        return story.story_id
+
+    def _similar(self, story: _Story) -> _Story | None:
+        candidates = set()
+        for table, band in zip(self._bands, story.bands):
+            candidates |= table.get(band, set())
+        best, best_score = None, self.similarity
+        for url in candidates:
+            other = self._stories[url]
+            score = jaccard(story.features, other.features)
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+    def _insert(self, story: _Story):
+        self._stories[story.url] = story
+        for table, band in zip(self._bands, story.bands):
+            table.setdefault(band, set()).add(story.url)
+
+    def _remove(self, story: _Story):
+        for table, band in zip(self._bands, story.bands):
+            urls = table.get(band)
+            if urls is not None:
+                urls.discard(story.url)
+                if not urls:
+                    del table[band]
+
+    def _prune(self):
+        cutoff = time.time() - self.window
+        stories = self._stories
+        while stories and (len(stories) > self.max_items or next(iter(stories.values())).seen_at < cutoff):
+            _, story = stories.popitem(last=False)
+            self._remove(story)
+
+    # ---------- 快照 ----------
+    def _read(self) -> list:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, records: list):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            records = await asyncio.to_thread(self._read)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"讀取 {self.path} 失敗：{e}")
+            return
+        for story_id, url, text, seen_at in records:
+            story = _Story(story_id, url, text, seen_at)
+            self._insert(story)
+        self._prune()
+
+    async def save(self):
+        """有變更才寫快照"""
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            records = [(s.story_id, s.url, s.text, s.seen_at) for s in self._stories.values()]
+            try:
+                await asyncio.to_thread(self._write, records)
+            except OSError as e:
+                self._dirty = True
+                logging.warning(f"寫入 {self.path} 失敗：{e}")
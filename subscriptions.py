@@ -0,0 +1,169 @@
+import asyncio, json, logging, os, time
+from dataclasses import dataclass, asdict
+from shared_state import file_lock
+
+MIN_POLL_INTERVAL = float(os.getenv("NEWS_MIN_POLL_INTERVAL", "120"))  # 秒，再怎麼加快也不低於此
+SPEEDUP_FLOOR = 4   # 有新消息時最快到訂閱間隔的 1/4
+BACKOFF_CEILING = 4  # 沒有新消息或出錯時最慢到訂閱間隔的 4 倍
+
+
+@dataclass
+class Subscription:
+    guild_id: int     # 0 = 還不知道（從 env 匯入的頻道，第一次發送時補上）
+    channel_id: int
+    source: str
+    interval: float   # 秒，使用者要求的抓取間隔
+
+    @property
+    def key(self) -> tuple[int, str]:
+        return (self.channel_id, self.source)
+
+
+class SubscriptionStore:
+    """(guild, channel, source, interval) 訂閱清單，存成 JSON，重啟後載回
+
+    多個程序（分片）共用同一個檔案時，每個程序只改自己負責的伺服器（owns(guild_id) 為 True），
+    存檔時在檔案鎖內與磁碟上其他程序的訂閱合併。
+    """
+
+    def __init__(self, path: str, owns=lambda guild_id: True):
+        self.path = path
+        self.owns = owns
+        self._subs: dict[tuple[int, str], Subscription] = {}
+        self._save_lock = asyncio.Lock()
+        self._mtime = 0
+
+    def __len__(self):
+        return len(self._subs)
+
+    def __iter__(self):
+        return iter(self._subs.values())
+
+    def for_source(self, source: str, owned: bool = False) -> list[Subscription]:
+        """owned=True 時只回傳這個程序負責發送的訂閱"""
+        return [s for s in self._subs.values() if s.source == source and (not owned or self.owns(s.guild_id))]
+
+    def for_guild(self, guild_id: int) -> list[Subscription]:
+        return [s for s in self._subs.values() if s.guild_id == guild_id]
+
+    def sources(self) -> set[str]:
+        return {s.source for s in self._subs.values()}
+
+    def add(self, sub: Subscription):
+        self._subs[sub.key] = sub
+
+    def remove(self, channel_id: int, source: str) -> Subscription | None:
+        return self._subs.pop((channel_id, source), None)
+
+    # ---------- 檔案 ----------
+    def _read(self) -> tuple[dict, int]:
+        with open(self.path, "r", encoding="utf-8") as f:
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+            raw = json.load(f)
+        subs = {}
+        for data in raw:
+            try:
+                sub = Subscription(**data)
+            except TypeError:
+                continue
+            subs[sub.key] = sub
+        return subs, mtime
+
+    def _merge(self, on_disk: dict, mine: dict) -> dict:
+        """自己負責的用記憶體中的版本，其他程序負責的以磁碟為準"""
+        merged = {k: v for k, v in on_disk.items() if not self.owns(v.guild_id)}
+        merged.update((k, v) for k, v in mine.items() if self.owns(v.guild_id))
+        return merged
+
+    def _write(self, mine: dict) -> tuple[dict, int]:
+        with file_lock(f"{self.path}.lock"):
+            try:
+                on_disk, _ = self._read()
+            except FileNotFoundError:
+                on_disk = {}
+            merged = self._merge(on_disk, mine)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([asdict(s) for s in merged.values()], f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            return on_disk, os.stat(self.path).st_mtime_ns
+
+    async def load(self) -> bool:
+        """回傳是否有讀到檔案（沒有時呼叫端可以從 env 匯入預設訂閱）"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            self._subs, self._mtime = await asyncio.to_thread(self._read)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"讀取 {self.path} 失敗：{e}")
+        return True
+
+    async def save(self):
+        async with self._save_lock:
+            try:
+                # 合併與寫檔在 worker thread，只傳快照過去；寫完再把其他程序的訂閱併回來
+                on_disk, self._mtime = await asyncio.to_thread(self._write, dict(self._subs))
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"寫入 {self.path} 失敗：{e}")
+                return
+            self._subs = self._merge(on_disk, self._subs)
+
+    async def reload_if_changed(self) -> bool:
+        """其他程序改過檔案時，載入它們負責的訂閱；回傳是否有變動"""
+        try:
+            if os.stat(self.path).st_mtime_ns == self._mtime:
+                return False
+            on_disk, self._mtime = await asyncio.to_thread(self._read)
+        except FileNotFoundError:
+            return False
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"讀取 {self.path} 失敗：{e}")
+            return False
+        self._subs = self._merge(on_disk, self._subs)
+        return True
+
+
+class SourceSchedule:
+    """單一來源的自適應抓取間隔
+
+    以訂閱者中最短的間隔為基準：
+    - 出現新消息 → 間隔減半（不低於基準的 1/4 與 MIN_POLL_INTERVAL）
+    - 沒有新消息 → 間隔拉長 1.5 倍；出錯 → 加倍（都不超過基準的 4 倍）
+    """
+
+    def __init__(self, source: str, base: float):
+        self.source = source
+        self.base = base
+        self.interval = base
+        self.next_due = 0.0  # 啟動後第一個 tick 就抓
+        self.errors = 0
+        self._last_urls: set[str] | None = None
+
+    def rebase(self, base: float):
+        """訂閱變動時調整基準，目前間隔等比例縮放"""
+        if base != self.base:
+            self.interval = self._clamp(self.interval * base / self.base, base)
+            self.next_due = min(self.next_due, time.monotonic() + self.interval)
+            self.base = base
+
+    def _clamp(self, interval: float, base: float | None = None) -> float:
+        base = base or self.base
+        floor = max(MIN_POLL_INTERVAL, base / SPEEDUP_FLOOR)
+        return max(min(floor, base), min(interval, base * BACKOFF_CEILING))
+
+    def due(self, now: float) -> bool:
+        return now >= self.next_due
+
+    def record(self, urls: list[str] | None):
+        """記錄一次抓取結果；urls 為 None 表示這次抓取失敗"""
+        if urls is None:
+            self.errors += 1
+            self.interval = self._clamp(self.interval * 2)
+        else:
+            self.errors = 0
+            current = set(urls)
+            if self._last_urls is not None:  # 第一次抓取沒有比較對象，維持原間隔
+                fresh = bool(current - self._last_urls)
+                self.interval = self._clamp(self.interval / 2 if fresh else self.interval * 1.5)
+            self._last_urls = current
+        self.next_due = time.monotonic() + self.interval
@@ -0,0 +1,105 @@
+import asyncio, logging, re, time
+from collections import OrderedDict
+from dataclasses import dataclass
+import aiohttp
+
+CONTENT_RANGE_RE = re.compile(r"/(\d+)$")
+
+
+@dataclass
+class ImageInfo:
+    ok: bool
+    content_type: str | None
+    size: int | None
+    checked_at: float
+
+
+class ThumbnailResolver:
+    """所有新聞來源共用的縮圖檢查
+
+    - 先送 HEAD；伺服器不支援 HEAD 時改用只要前 1 KiB 的 range GET
+    - 是圖片、大小在範圍內才算有效（過小的多半是 1x1 佔位圖）
+    - 結果（有效/無效、content-type、大小）以 URL 快取，ttl 到期或超過 max_entries 時以 LRU 淘汰；
+      連線錯誤只快取 error_ttl，稍後再試
+    - 同一個 URL 同時只會有一個檢查請求
+    """
+
+    def __init__(self, get_session, semaphore_for, ttl: float = 24 * 3600, error_ttl: float = 600,
+                 max_entries: int = 4096, timeout: float = 5, min_bytes: int = 512, max_bytes: int = 20 * 1024 * 1024):
+        self.get_session = get_session      # () -> aiohttp.ClientSession（共用連線池）
+        self.semaphore_for = semaphore_for  # url -> asyncio.Semaphore（同主機併發上限）
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[str, tuple[ImageInfo, float]] = OrderedDict()  # url -> (結果, 到期時間)
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def cached(self, url: str) -> ImageInfo | None:
+        entry = self._cache.get(url)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            del self._cache[url]
+            return None
+        self._cache.move_to_end(url)
+        return entry[0]
+
+    def _remember(self, url: str, info: ImageInfo, ttl: float):
+        self._cache[url] = (info, time.monotonic() + ttl)
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _request(self, method: str, url: str, headers: dict | None = None):
+        async with self.semaphore_for(url):
+            async with self.get_session().request(method, url, headers=headers, allow_redirects=True,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout)) as r:
+                size = r.headers.get("Content-Length")
+                if r.status == 206:  # range GET：總大小在 Content-Range 的最後
+                    m = CONTENT_RANGE_RE.search(r.headers.get("Content-Range", ""))
+                    size = m.group(1) if m else None
+                return r.status, r.content_type, int(size) if size and size.isdigit() else None
+
+    async def _probe(self, url: str) -> ImageInfo:
+        try:
+            status, content_type, size = await self._request("HEAD", url)
+            if status in (403, 405, 501) or (status == 200 and not content_type.startswith("image/")):
+                # 有些 CDN 不支援 HEAD 或對 HEAD 回傳錯誤的 content-type
+                status, content_type, size = await self._request("GET", url, {"Range": "bytes=0-1023"})
+        except Exception as e:
+            # 連線錯誤之外，格式怪異的網址也可能讓 aiohttp 拋出其他例外：一律當成無效圖片，不影響整個來源
+            logging.debug(f"縮圖檢查失敗 {url}: {e!r}")
+            info = ImageInfo(False, None, None, time.time())
+            self._remember(url, info, self.error_ttl)
+            return info
+
+        ok = (status in (200, 206) and content_type.startswith("image/")
+              and (size is None or self.min_bytes <= size <= self.max_bytes))
+        info = ImageInfo(ok, content_type, size, time.time())
+        self._remember(url, info, self.ttl)
+        return info
+
+    async def check(self, url: str) -> ImageInfo:
+        info = self.cached(url)
+        if info is not None:
+            self.hits += 1
+            return info
+        self.misses += 1
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.create_task(self._probe(url))
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+            self._inflight[url] = task
+        return await asyncio.shield(task)
+
+    async def resolve(self, *candidates: str | None) -> str | None:
+        """依序檢查候選網址，回傳第一個有效的；都無效時回傳 None（文章照發，只是沒有縮圖）"""
+        for url in candidates:
+            if url and (await self.check(url)).ok:
+                return url
+        return None